@@ -0,0 +1,55 @@
+import json
+import argparse
+import sys
+import time
+sys.path.insert(0, './')
+from train_dataloader import *
+from decoding import DECODING_PROFILES, generation_kwargs
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from peft import PeftModel
+from rouge_metrics import rouge_f
+
+
+def run_profile(model, tokenizer, dataloader, device, profile, max_new_tokens, perspective_budget):
+    # Returns (seconds per example, generated summaries, reference summaries).
+    gen = []
+    actual = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for batch in dataloader:
+            decoding = generation_kwargs(profile, max_new_tokens, batch["perspective"] if perspective_budget else None, repetition_penalty=1.2)
+            outputs = model.generate(input_ids=batch["input_ids"].to(device), attention_mask=batch["attention_mask"].to(device), **decoding)
+            gen.extend(tokenizer.batch_decode(outputs, skip_special_tokens=True))
+            actual.extend(batch["Summary"])
+    return (time.perf_counter() - start) / max(len(gen), 1), gen, actual
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Latency per example and ROUGE for each decoding profile.")
+    parser.add_argument('--test_file', required=True, help="records with reference 'Summary' and 'Perspective'")
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument("--ckpt_dir", type=str, required=True)
+    parser.add_argument("--ckpt_name", type=str, required=True)
+    parser.add_argument('--num_examples', type=int, default=50)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument("--max_new_tokens", type=int, default=500)
+    parser.add_argument("--perspective_budget", action="store_true")
+    parser.add_argument("--profiles", nargs="+", default=list(DECODING_PROFILES), choices=list(DECODING_PROFILES))
+    parser.add_argument("--device", type=str, default='cpu')
+    args = parser.parse_args()
+
+    with open(args.test_file, 'r') as json_file:
+        test_data = json.load(json_file)[:args.num_examples]
+    foundation_model = AutoModelForSeq2SeqLM.from_pretrained(args.model_file).to(args.device)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_file)
+    model = PeftModel.from_pretrained(foundation_model, f"{args.ckpt_dir}/{args.ckpt_name}", is_trainable=False).to(args.device)
+    model.eval()
+
+    test_dataset = CustomDataset(test_data, tokenizer, pad_to_max_length=False)
+    test_dataloader = test_create_dataloader(test_dataset, args.batch_size, group_by_length=True)
+
+    print(f"{'profile':>12} | {'sec/example':>11} | {'rouge-1':>7} | {'rouge-2':>7} | {'rouge-l':>7}")
+    for profile in args.profiles:
+        seconds, gen, actual = run_profile(model, tokenizer, test_dataloader, args.device, profile, args.max_new_tokens, args.perspective_budget)
+        rouge = list(rouge_f(gen, actual).values())
+        print(f"{profile:>12} | {seconds:11.3f} | {rouge[0]:7.4f} | {rouge[1]:7.4f} | {rouge[2]:7.4f}")
@@ -0,0 +1,46 @@
+import argparse
+import re
+import subprocess
+import sys
+
+# `python -X importtime` writes "import time: <self us> | <cumulative us> | <indented module name>" to stderr.
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def import_times(command):
+    """
+    Runs a command under `python -X importtime`.
+
+    Args:
+        command (list): Script and arguments, e.g. ['train.py', '--help']
+
+    Returns:
+        list: (module, cumulative microseconds) for every top-level import, slowest first
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", *command], capture_output=True, text=True)
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Nested imports are indented by two extra spaces per level; top-level ones by a single space.
+        if match and len(match.group(3)) == 1:
+            top_level.append((match.group(4), int(match.group(2))))
+    return sorted(top_level, key=lambda item: item[1], reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget check for the Starter_Code entry points.")
+    parser.add_argument("--max_ms", type=float, default=200.0,
+                        help="fail when an entry point spends longer than this importing before --help returns")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for command in [["train.py", "--help"], ["infer.py", "--help"]]:
+        times = import_times(command)
+        total_ms = sum(us for _, us in times) / 1000
+        status = "OK" if total_ms <= args.max_ms else "SLOW"
+        failed |= total_ms > args.max_ms
+        print(f"{' '.join(command):>16}: {total_ms:8.1f} ms importing [{status}]")
+        for module, us in times[:args.top]:
+            print(f"{'':>18}{module:<30} {us / 1000:8.1f} ms")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,55 @@
+import json
+import argparse
+import sys
+import time
+sys.path.insert(0, './')
+from train_dataloader import *
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+
+def run(model, dataloader, device, max_batches):
+    # Forward + backward over up to max_batches batches; returns (real tokens, padded tokens, seconds).
+    real_tokens = 0
+    padded_tokens = 0
+    start = time.perf_counter()
+    for i, batch in enumerate(dataloader):
+        if i >= max_batches:
+            break
+        input_ids = batch['input_ids'].to(device)
+        attention_mask = batch['attention_mask'].to(device)
+        labels = batch['labels'].to(device)
+        outputs = model(input_ids, attention_mask=attention_mask, labels=labels)
+        outputs.loss.backward()
+        model.zero_grad()
+        real_tokens += int(attention_mask.sum())
+        padded_tokens += input_ids.numel()
+    return real_tokens, padded_tokens, time.perf_counter() - start
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Compare fixed max_length padding against dynamic padding.")
+    parser.add_argument('--train_file', required=True)
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--max_batches', type=int, default=20)
+    parser.add_argument("--device", type=str, default='cpu')
+    args = parser.parse_args()
+
+    with open(args.train_file, 'r') as json_file:
+        train_data = json.load(json_file)
+    model = AutoModelForSeq2SeqLM.from_pretrained(args.model_file).to(args.device)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_file)
+    model.train()
+
+    modes = [
+        ("fixed-1024", dict(pad_to_max_length=True), False),
+        ("dynamic", dict(pad_to_max_length=False), False),
+        ("dynamic+grouped", dict(pad_to_max_length=False), True),
+    ]
+    for name, dataset_kwargs, group_by_length in modes:
+        dataset = CustomDataset(train_data, tokenizer, **dataset_kwargs)
+        dataloader, _ = create_dataloader(dataset, dataset, args.batch_size, args.batch_size, group_by_length=group_by_length)
+        real_tokens, padded_tokens, seconds = run(model, dataloader, args.device, args.max_batches)
+        print(f"{name:>16}: {real_tokens / seconds:10.1f} real tokens/sec | "
+              f"{padded_tokens / seconds:10.1f} padded tokens/sec | "
+              f"pad fraction {1 - real_tokens / max(padded_tokens, 1):.2%} | {seconds:.2f}s")
@@ -0,0 +1,72 @@
+import json
+import argparse
+import sys
+import time
+sys.path.insert(0, './')
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from train_dataloader import *
+from decoding import DECODING_PROFILES
+from quantization import QUANTIZE_MODES, quantize_peft_model, model_size_mb, peak_rss_mb, rss_mb
+from benchmark_decoding import run_profile
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from peft import PeftModel
+from rouge_metrics import rouge_f
+
+
+def run_mode(args, mode):
+    # Runs in a fresh process per mode, so peak RSS is not shared between fp32 and int8.
+    torch.set_num_threads(args.num_threads)
+    with open(args.test_file, 'r') as json_file:
+        test_data = json.load(json_file)[:args.num_examples]
+    start = time.perf_counter()
+    foundation_model = AutoModelForSeq2SeqLM.from_pretrained(args.model_file)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_file)
+    model = PeftModel.from_pretrained(foundation_model, f"{args.ckpt_dir}/{args.ckpt_name}", is_trainable=False)
+    model.eval()
+    quantize_peft_model(model, mode)
+    load_seconds = time.perf_counter() - start
+
+    test_dataset = CustomDataset(test_data, tokenizer, pad_to_max_length=False)
+    test_dataloader = test_create_dataloader(test_dataset, args.batch_size, group_by_length=True)
+    seconds, gen, actual = run_profile(model, tokenizer, test_dataloader, 'cpu', args.decoding_profile, args.max_new_tokens, args.perspective_budget)
+    return {"mode": mode, "load_seconds": load_seconds, "sec_per_example": seconds, "weights_mb": model_size_mb(model),
+            "rss_mb": rss_mb(), "peak_rss_mb": peak_rss_mb(), "generated": gen, "reference": actual}
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="CPU latency, memory and ROUGE of int8 dynamic quantization against fp32.")
+    parser.add_argument('--test_file', required=True, help="records with reference 'Summary' and 'Perspective'")
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument("--ckpt_dir", type=str, required=True)
+    parser.add_argument("--ckpt_name", type=str, required=True)
+    parser.add_argument('--num_examples', type=int, default=50)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument("--max_new_tokens", type=int, default=500)
+    parser.add_argument("--perspective_budget", action="store_true")
+    parser.add_argument("--decoding_profile", type=str, default="full-beam", choices=list(DECODING_PROFILES))
+    parser.add_argument("--modes", nargs="+", default=QUANTIZE_MODES, choices=QUANTIZE_MODES)
+    parser.add_argument("--num_threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--report_file", type=str, default=None, help="also write the report and generated texts as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            results.append(pool.submit(run_mode, args, mode).result())
+
+    # ROUGE against the references, and ROUGE-L against the fp32 outputs as a measure of how far quantization moves them.
+    baseline = next((result for result in results if result["mode"] == "none"), None)
+    print(f"{'mode':>5} | {'load s':>6} | {'sec/example':>11} | {'speedup':>7} | {'weights MB':>10} | {'rss MB':>7} | {'peak rss MB':>11} | {'rouge-1':>7} | {'rouge-2':>7} | {'rouge-l':>7} | {'vs fp32':>7}")
+    for result in results:
+        result["rouge"] = rouge_f(result["generated"], result["reference"])
+        result["speedup"] = baseline["sec_per_example"] / result["sec_per_example"] if baseline else None
+        result["rouge_l_vs_fp32"] = rouge_f(result["generated"], baseline["generated"])["rouge-l"] if baseline else None
+        speedup = f"{result['speedup']:6.2f}x" if baseline else f"{'-':>7}"
+        agreement = f"{result['rouge_l_vs_fp32']:7.4f}" if baseline else f"{'-':>7}"
+        print(f"{result['mode']:>5} | {result['load_seconds']:6.1f} | {result['sec_per_example']:11.3f} | {speedup} | {result['weights_mb']:10.0f} | {result['rss_mb']:7.0f} | {result['peak_rss_mb']:11.0f} | "
+              f"{result['rouge']['rouge-1']:7.4f} | {result['rouge']['rouge-2']:7.4f} | {result['rouge']['rouge-l']:7.4f} | {agreement}")
+
+    if args.report_file is not None:
+        with open(args.report_file, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,162 @@
+import copy
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+
+import numpy as np
+import torch
+from peft import get_peft_model_state_dict, set_peft_model_state_dict
+
+
+def _to_cpu(obj):
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class CheckpointManager:
+    """Writes resumable training checkpoints on a background thread.
+
+    A checkpoint ``name`` is an adapter directory ``{ckpt_dir}/{name}`` (loadable with
+    ``PeftModel.from_pretrained``) plus ``{ckpt_dir}/{name}.ckpt`` holding the adapter weights,
+    optimizer, scheduler and RNG state, and the epoch/step position in the data. Everything is
+    copied to CPU on the calling thread, so training continues while the files are written.
+
+    ``last`` is overwritten by every periodic save and is what a preempted run resumes from.
+    ``best_*`` checkpoints are ranked by validation loss and only the ``keep_top_k`` best are
+    kept; the ranking is persisted in ``{ckpt_dir}/checkpoints.json``.
+    """
+
+    def __init__(self, ckpt_dir, keep_top_k=3):
+        self.ckpt_dir = ckpt_dir
+        self.keep_top_k = keep_top_k
+        self.index_path = os.path.join(ckpt_dir, 'checkpoints.json')
+        os.makedirs(ckpt_dir, exist_ok=True)
+        self.best = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.best = json.load(f)['best']
+        self.queue = queue.Queue()
+        self.error = None
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is not None:
+                    job()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if job is None:
+                return
+
+    def _submit(self, job):
+        if self.error is not None:
+            raise RuntimeError(f"A previous checkpoint write failed: {self.error}")
+        self.queue.put(job)
+
+    def _snapshot(self, model, optimizer, scheduler, epoch, step, **extra):
+        peft_config = copy.deepcopy(model.peft_config[model.active_adapter])
+        peft_config.inference_mode = True
+        state = {
+            'peft_config': peft_config,
+            'model_state_dict': _to_cpu(get_peft_model_state_dict(model)),
+            'optim_state_dict': _to_cpu(optimizer.state_dict()),
+            'sched_state_dict': copy.deepcopy(scheduler.state_dict()),
+            'rng_state': rng_state(),
+            'epoch': epoch,
+            'step': step,
+        }
+        state.update(_to_cpu(extra))
+        return state
+
+    def _write(self, name, state):
+        path = os.path.join(self.ckpt_dir, name)
+        # Adapter directory in the layout PeftModel.from_pretrained reads, written from the snapshot
+        # rather than the live model, which keeps training while this runs.
+        os.makedirs(path, exist_ok=True)
+        state['peft_config'].save_pretrained(path)
+        torch.save(state['model_state_dict'], os.path.join(path, 'adapter_model.bin'))
+        tmp_path = f"{path}.ckpt.tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, f"{path}.ckpt")
+
+    def save_last(self, model, optimizer, scheduler, epoch, step, **extra):
+        """Snapshots the full training state as ``last``; ``step`` is the number of batches done in ``epoch``."""
+        state = self._snapshot(model, optimizer, scheduler, epoch, step, **extra)
+        self._submit(lambda: self._write('last', state))
+
+    def save_best(self, model, optimizer, scheduler, epoch, step, valid_loss, **extra):
+        """Saves a checkpoint ranked by ``valid_loss`` and drops the ones outside the top K."""
+        name = f"best_ckpt_epoch={epoch}_valid_loss={round(valid_loss, 4)}"
+        state = self._snapshot(model, optimizer, scheduler, epoch, step, valid_loss=valid_loss, **extra)
+        self.best.append({'name': name, 'valid_loss': valid_loss, 'epoch': epoch})
+        self.best.sort(key=lambda entry: entry['valid_loss'])
+        dropped, self.best = self.best[self.keep_top_k:], self.best[:self.keep_top_k]
+        best = list(self.best)
+
+        def job():
+            if any(entry['name'] == name for entry in best):
+                self._write(name, state)
+            for entry in dropped:
+                path = os.path.join(self.ckpt_dir, entry['name'])
+                shutil.rmtree(path, ignore_errors=True)
+                if os.path.exists(f"{path}.ckpt"):
+                    os.remove(f"{path}.ckpt")
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump({'best': best}, f, indent=2)
+
+        self._submit(job)
+        return name
+
+    def wait(self):
+        """Blocks until every queued checkpoint is on disk."""
+        self.queue.join()
+        if self.error is not None:
+            raise RuntimeError(f"A checkpoint write failed: {self.error}")
+
+    def close(self):
+        self.wait()
+        self.queue.put(None)
+        self.worker.join()
+
+
+def load_checkpoint(path, model, optimizer=None, scheduler=None, device='cpu'):
+    """Restores adapter weights (and optimizer/scheduler when given) from a ``.ckpt`` file and returns it."""
+    ckpt = torch.load(path, map_location='cpu', weights_only=False)
+    set_peft_model_state_dict(model, {k: v.to(device) for k, v in ckpt['model_state_dict'].items()})
+    if optimizer is not None:
+        optimizer.load_state_dict(ckpt['optim_state_dict'])
+    if scheduler is not None:
+        scheduler.load_state_dict(ckpt['sched_state_dict'])
+    return ckpt
@@ -0,0 +1,59 @@
+# Named decoding profiles for model.generate. `temperature`/`top_p` only take effect with do_sample=True,
+# so they are set on the sampling profile only.
+DECODING_PROFILES = {
+    "greedy": {"num_beams": 1, "do_sample": False},
+    "small-beam": {"num_beams": 2, "do_sample": False, "early_stopping": True, "length_penalty": 1.0},
+    # The baseline's original call: only the beam count, leaving early stopping and the length
+    # penalty to the model's generation config.
+    "full-beam": {"num_beams": 5},
+    "sampling": {"num_beams": 1, "do_sample": True, "temperature": 0.9, "top_p": 0.95},
+}
+
+# New-token budgets per perspective: questions are one short sentence, information summaries run longest.
+PERSPECTIVE_TOKEN_BUDGETS = {
+    "QUESTION": 48,
+    "CAUSE": 96,
+    "EXPERIENCE": 128,
+    "SUGGESTION": 128,
+    "INFORMATION": 160,
+}
+
+
+def generation_kwargs(profile, max_new_tokens=None, perspectives=None, length_penalty=None, repetition_penalty=None):
+    """
+    Builds the keyword arguments for model.generate.
+
+    Args:
+        profile (str): Name of a profile in DECODING_PROFILES
+        max_new_tokens (int): Fixed new-token budget; used as the fallback budget when perspectives are given
+        perspectives (list): Perspectives of the batch; when given, the budget is the largest
+            PERSPECTIVE_TOKEN_BUDGETS entry among them (a batch shares one generate call),
+            capped at max_new_tokens
+        length_penalty (float): Overrides the profile's beam length penalty
+        repetition_penalty (float): Optional repetition penalty
+
+    Returns:
+        dict: Keyword arguments for model.generate
+    """
+    if profile not in DECODING_PROFILES:
+        raise ValueError(f"Unknown decoding profile {profile}; choose from {', '.join(DECODING_PROFILES)}")
+    kwargs = dict(DECODING_PROFILES[profile])
+
+    if perspectives:
+        budget = max(PERSPECTIVE_TOKEN_BUDGETS.get(str(p).strip(), max_new_tokens) for p in perspectives)
+        kwargs["max_new_tokens"] = min(budget, max_new_tokens) if max_new_tokens is not None else budget
+    else:
+        kwargs["max_new_tokens"] = max_new_tokens
+    if length_penalty is not None and kwargs["num_beams"] > 1:
+        kwargs["length_penalty"] = length_penalty
+    if repetition_penalty is not None:
+        kwargs["repetition_penalty"] = repetition_penalty
+    return kwargs
+
+
+def add_decoding_args(parser, default_profile="full-beam", default_max_new_tokens=100):
+    parser.add_argument("--decoding_profile", type=str, default=default_profile, choices=list(DECODING_PROFILES))
+    parser.add_argument("--max_new_tokens", type=int, default=default_max_new_tokens)
+    parser.add_argument("--perspective_budget", action="store_true",
+                        help="cap new tokens per batch by the perspective budgets; --max_new_tokens stays the upper bound")
+    parser.add_argument("--length_penalty", type=float, default=None)
@@ -1,18 +1,14 @@
 import json
 import argparse 
-from transformers.file_utils import PushToHubMixin
-from transformers import GPT2Tokenizer, GPT2Model,GPT2LMHeadModel,AutoModelForSeq2SeqLM,AutoTokenizer
-from peft import get_peft_config, get_peft_model, get_peft_model_state_dict, PrefixTuningConfig, TaskType,PeftModel
 import sys
 sys.path.insert(0, './') 
-from src.train_dataloader import * 
-from transformers import Seq2SeqTrainer, Seq2SeqTrainingArguments, DataCollatorForSeq2Seq
-from transformers import AdamW, get_linear_schedule_with_warmup
-from tqdm import tqdm
-import numpy as np
 import os
-import pandas as pd
-device = 'cuda'
+import time
+from pathlib import Path
+from result_writer import ResultWriter
+from decoding import add_decoding_args, generation_kwargs
+from quantization import add_quantization_args, check_quantization_args, quantize_peft_model, model_size_mb, peak_rss_mb
+
 if __name__=="__main__":
 
 ##########################################################################
@@ -25,12 +21,42 @@ if __name__=="__main__":
     parser.add_argument("--num_epochs", type=int, default=None)
     parser.add_argument("--ckpt_dir", type=str, default=None)
     parser.add_argument("--ckpt_name", type=str, default=None)
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="pre-tokenize the test set once and cache it in this directory")
+    parser.add_argument("--dynamic_padding", action="store_true",
+                        help="pad each batch to its longest item instead of max_length")
+    parser.add_argument("--sort_by_length", action="store_true",
+                        help="batch test examples of similar length together to cut padding")
+    parser.add_argument("--output_file", type=str, default='./generated/generated_result.csv')
+    parser.add_argument("--output_format", type=str, default='csv', choices=['csv', 'jsonl', 'submission'])
+    parser.add_argument("--flush_every", type=int, default=64,
+                        help="number of generated rows buffered before each write")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep rows already in --output_file and skip their records")
+    parser.add_argument("--print_results", action="store_true")
+    add_decoding_args(parser, default_profile="full-beam", default_max_new_tokens=500)
+    parser.add_argument("--repetition_penalty", type=float, default=1.2)
+    add_quantization_args(parser, default_device='cuda')
     
     args = parser.parse_args()
+    if not os.path.exists(args.test_file):
+        parser.error(f"file not found: {args.test_file}")
+    check_quantization_args(parser, args)
+    device = args.device
+
+    # Heavy imports are deferred until the arguments are valid, so --help and argument errors return immediately.
+    import torch
+    from transformers import AutoModelForSeq2SeqLM,AutoTokenizer
+    from peft import PeftModel
+    from tqdm import tqdm
+    from src.train_dataloader import * 
+    # corpus_store.py lives one directory up, next to json_split.py; it pulls in numpy.
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from corpus_store import load_corpus
     
     TEST_BATCH_SIZE = args.batch_size_test
-    with open(args.test_file, 'r') as json_file:
-        test_data = json.load(json_file)
+    # Either a JSON file or a corpus store directory from corpus_store.py.
+    test_data = load_corpus(args.test_file, exclude=['raw_text'])
     EPOCHS = args.num_epochs
     
     foundation_model = AutoModelForSeq2SeqLM.from_pretrained(args.model_file).to(device)
@@ -43,30 +69,42 @@ if __name__=="__main__":
     peft_model_path,   # The path where the trained Peft model is saved
     is_trainable=False  # Indicates that the loaded model should not be trainable
     ).to(device)
+    loaded_model.eval()
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    if args.quantize != 'none':
+        # After PeftModel loading, so the adapter binds to the fp32 modules and the prefix encoder stays fp32.
+        quantize_peft_model(loaded_model, args.quantize)
+        print(f"Quantized the foundation model to {args.quantize}: {model_size_mb(loaded_model):.0f} MB of weights")
     
-    test_dataset = CustomDataset(test_data,tokenizer)
-    test_dataloader = test_create_dataloader(test_dataset, TEST_BATCH_SIZE)
+    writer = ResultWriter(args.output_file, args.output_format, flush_every=args.flush_every, resume=args.resume)
+    pending = [idx for idx in range(len(test_data)) if idx not in writer.done]
+    if len(pending) < len(test_data):
+        print(f"Resuming: {len(test_data) - len(pending)} records already written to {args.output_file}")
+    # The pre-tokenized cache is keyed by the file hash, so it only applies when the whole file is processed.
+    test_dataset = CustomDataset([test_data[idx] for idx in pending],tokenizer, cache_dir=args.cache_dir, data_file=args.test_file if len(pending) == len(test_data) else None, pad_to_max_length=not args.dynamic_padding)
+    test_dataloader = test_create_dataloader(test_dataset, TEST_BATCH_SIZE, group_by_length=args.sort_by_length)
 
-            
+    num_samples = 0
+    start_time = time.perf_counter()
     with torch.no_grad():
         for step, batch in enumerate(tqdm(test_dataloader)):
             input_text = batch["input_ids"].to(device)
             input_attention = batch["attention_mask"].to(device)
-            outputs =  loaded_model.generate(input_ids=input_text,attention_mask=input_attention,num_beams=5, max_new_tokens=500,temperature=0.9, repetition_penalty=1.2)
+            decoding = generation_kwargs(args.decoding_profile, args.max_new_tokens, batch["perspective"] if args.perspective_budget else None, args.length_penalty, args.repetition_penalty)
+            outputs =  loaded_model.generate(input_ids=input_text,attention_mask=input_attention,**decoding)
          
-            output_text = tokenizer.decode(outputs[0]).replace('<pad>','').replace('</s>','').strip(" ")
-            data = {'PERSPECTIVE':test_data[step]['Perspective'],'PREDICTED': [output_text], 'ACTUAL OUTPUT':test_data[step]['Summary'],'INPUT':[test_data[step]['answers']]}
-            print(data)
-            df= pd.DataFrame(data)
-            df.to_csv('./generated/generated_result.csv', mode='a', index=False, header=False)
-
-        
-
-
-
-
-
-
-
-
+            # Decode every sequence of the batch and map it back to its source record by dataset index.
+            output_texts = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for idx, output_text in zip(batch["index"].tolist(), output_texts):
+                record = test_data[pending[idx]]
+                writer.add(pending[idx], record, output_text.strip(" "))
+                if args.print_results:
+                    print({'PERSPECTIVE':record.get('Perspective'),'PREDICTED': output_text.strip(" ")})
+            num_samples += len(output_texts)
+    writer.close()
 
+    elapsed = time.perf_counter() - start_time
+    print(f"Generated {num_samples} samples in {elapsed:.1f}s ({num_samples / elapsed:.2f} samples/sec, batch size {TEST_BATCH_SIZE})")
+    if torch.device(device).type == 'cpu':
+        print(f"Peak RSS: {peak_rss_mb():.0f} MB")
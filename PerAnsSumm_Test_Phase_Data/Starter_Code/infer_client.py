@@ -0,0 +1,72 @@
+import json
+import argparse
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+class InferenceClient:
+    """Plain-Python client for infer_server.py."""
+
+    def __init__(self, url='http://127.0.0.1:8765', timeout=3600):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def health(self):
+        with urllib.request.urlopen(f"{self.url}/health", timeout=self.timeout) as response:
+            return json.load(response)
+
+    def generate(self, records, adapter, perspectives=None, decoding_profile='full-beam', max_new_tokens=500):
+        """
+        Generates perspective summaries for records in the test_no_label.json schema.
+
+        Args:
+            records (list): Records with 'uri', 'question', 'context' and 'answers'
+            adapter (str): Checkpoint name of the prefix-tuning adapter under the server's --ckpt_dir
+            perspectives (list): Perspectives to summarise; all five when None
+            decoding_profile (str): Name of a profile in decoding.DECODING_PROFILES
+            max_new_tokens (int): New-token budget per summary
+
+        Returns:
+            list: One submission-shaped entry ('uri', 'spans', 'summaries') per record
+        """
+        payload = {
+            'adapter': adapter,
+            'records': records,
+            'perspectives': perspectives,
+            'decoding_profile': decoding_profile,
+            'max_new_tokens': max_new_tokens,
+        }
+        request = urllib.request.Request(
+            f"{self.url}/generate",
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)['results']
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Server error {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send test_no_label shards to a running infer_server.py.")
+    parser.add_argument('test_files', nargs='+', help="e.g. test_no_label_split/test_no_label_part*.json")
+    parser.add_argument('--adapter', type=str, required=True)
+    parser.add_argument('--output_dir', type=str, default='./generated')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8765')
+    parser.add_argument('--decoding_profile', type=str, default='full-beam')
+    parser.add_argument('--max_new_tokens', type=int, default=500)
+    args = parser.parse_args()
+
+    client = InferenceClient(args.url)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for test_file in args.test_files:
+        with open(test_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        results = client.generate(records, args.adapter, decoding_profile=args.decoding_profile, max_new_tokens=args.max_new_tokens)
+        output_path = output_dir / f"{Path(test_file).stem}_summaries.json"
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"{test_file}: {len(results)} entries written to {output_path}")
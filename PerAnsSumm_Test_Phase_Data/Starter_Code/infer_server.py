@@ -0,0 +1,201 @@
+import json
+import argparse
+import sys
+sys.path.insert(0, './')
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decoding import generation_kwargs
+
+CATEGORIES = ['EXPERIENCE', 'INFORMATION', 'CAUSE', 'SUGGESTION', 'QUESTION']
+
+
+class GenerationRequest:
+    def __init__(self, adapter, records, perspectives, decoding):
+        self.adapter = adapter
+        self.decoding = decoding
+        self.future = Future()
+        self.entries = [{
+            'uri': record['uri'],
+            'spans': {category: [] for category in CATEGORIES},
+            'summaries': {category: "" for category in CATEGORIES},
+        } for record in records]
+        # One generation item per (record, perspective); CustomDataset builds its prompt.
+        self.items = [(i, dict(record, Perspective=perspective, Summary=''))
+                      for i, record in enumerate(records) for perspective in perspectives]
+
+    @property
+    def key(self):
+        # Requests can share a generate call only with the same adapter and decoding settings.
+        return self.adapter, json.dumps(self.decoding, sort_keys=True)
+
+
+class InferenceEngine:
+    """Holds the foundation model in memory and serves prefix-tuning adapters by checkpoint name.
+
+    The base model and tokenizer are loaded once. Adapters are loaded from ``{ckpt_dir}/{name}`` on
+    first use and switched with ``set_adapter`` afterwards. Requests queued within ``max_wait_ms``
+    of each other are merged into generate calls of up to ``max_batch_size`` sequences.
+    """
+
+    def __init__(self, model_file, ckpt_dir, device='cpu', max_batch_size=8, max_wait_ms=50, max_length=1024):
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        self.torch = torch
+        self.ckpt_dir = ckpt_dir
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_length = max_length
+        self.base_model = AutoModelForSeq2SeqLM.from_pretrained(model_file).to(device)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_file)
+        self.model = None
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    @property
+    def adapters(self):
+        return [] if self.model is None else list(self.model.peft_config)
+
+    def submit(self, adapter, records, perspectives=None, decoding_profile='full-beam', max_new_tokens=500, repetition_penalty=1.2):
+        if os.path.basename(adapter) != adapter or adapter in ('', '.', '..'):
+            raise ValueError(f"Invalid adapter name: {adapter}")
+        perspectives = perspectives or CATEGORIES
+        unknown = set(perspectives) - set(CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unknown perspectives: {sorted(unknown)}")
+        for record in records:
+            for field in ['uri', 'question', 'answers']:
+                if field not in record:
+                    raise ValueError(f"Record is missing required field '{field}'")
+        decoding = generation_kwargs(decoding_profile, max_new_tokens, repetition_penalty=repetition_penalty)
+        request = GenerationRequest(adapter, records, perspectives, decoding)
+        self.queue.put(request)
+        return request.future
+
+    def _activate(self, adapter):
+        from peft import PeftModel
+        path = os.path.join(self.ckpt_dir, adapter)
+        if self.model is None:
+            self.model = PeftModel.from_pretrained(self.base_model, path, adapter_name=adapter, is_trainable=False).to(self.device)
+            self.model.eval()
+        elif adapter not in self.model.peft_config:
+            self.model.load_adapter(path, adapter_name=adapter, is_trainable=False)
+        self.model.set_adapter(adapter)
+
+    def _collect(self):
+        requests = [self.queue.get()]
+        num_items = len(requests[0].items)
+        deadline = time.monotonic() + self.max_wait
+        while num_items < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            num_items += len(request.items)
+        return requests
+
+    def _run(self):
+        from train_dataloader import CustomDataset
+        while True:
+            requests = self._collect()
+            groups = {}
+            for request in requests:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                try:
+                    self._activate(group[0].adapter)
+                    items = [(request, i, record) for request in group for i, record in request.items]
+                    for start in range(0, len(items), self.max_batch_size):
+                        self._generate(CustomDataset, items[start:start + self.max_batch_size], group[0].decoding)
+                    for request in group:
+                        request.future.set_result(request.entries)
+                except Exception as e:
+                    for request in group:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+
+    def _generate(self, CustomDataset, items, decoding):
+        dataset = CustomDataset([record for _, _, record in items], self.tokenizer, max_length=self.max_length)
+        prompts = [dataset.build_example(idx)[0] for idx in range(len(dataset))]
+        inputs = self.tokenizer(prompts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt").to(self.device)
+        with self.torch.no_grad():
+            outputs = self.model.generate(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"], **decoding)
+        for (request, i, record), text in zip(items, self.tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+            request.entries[i]['summaries'][record['Perspective']] = text.strip()
+
+
+def make_handler(engine):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._reply(200, {'status': 'ok', 'adapters': engine.adapters})
+            else:
+                self._reply(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self._reply(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                records = payload['records']
+                future = engine.submit(
+                    payload['adapter'],
+                    records if isinstance(records, list) else [records],
+                    perspectives=payload.get('perspectives'),
+                    decoding_profile=payload.get('decoding_profile', 'full-beam'),
+                    max_new_tokens=payload.get('max_new_tokens', 500),
+                    repetition_penalty=payload.get('repetition_penalty', 1.2),
+                )
+            except (KeyError, ValueError, TypeError) as e:
+                self._reply(400, {'error': str(e)})
+                return
+            try:
+                self._reply(200, {'results': future.result()})
+            except Exception as e:
+                self._reply(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived inference server for prefix-tuned summarisation adapters.")
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument("--ckpt_dir", type=str, required=True, help="directory holding adapter checkpoints by name")
+    parser.add_argument("--preload", nargs="*", default=[], help="adapter names to load at start-up")
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--device", type=str, default='cpu')
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--max_wait_ms", type=float, default=50)
+    parser.add_argument("--num_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(args.model_file, args.ckpt_dir, args.device, args.max_batch_size, args.max_wait_ms)
+    if args.num_threads is not None:
+        engine.torch.set_num_threads(args.num_threads)
+    for adapter in args.preload:
+        engine._activate(adapter)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(engine))
+    print(f"Serving on http://{args.host}:{args.port} (adapters loaded: {engine.adapters})")
+    server.serve_forever()
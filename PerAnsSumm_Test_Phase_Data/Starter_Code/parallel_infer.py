@@ -0,0 +1,171 @@
+import json
+import argparse
+import sys
+sys.path.insert(0, './')
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+# combine_json.py lives one directory up, next to json_split.py.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from combine_json import JSONValidationError, validate_and_fix_entry, extract_file_number
+
+_engine = None
+
+
+def _init_worker(model_file, ckpt_dir, adapter, num_threads, max_batch_size):
+    # Each worker owns one model copy and a bounded number of torch threads, so
+    # workers x threads stays within the machine's cores.
+    global _engine
+    import torch
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    from infer_server import InferenceEngine
+    _engine = InferenceEngine(model_file, ckpt_dir, device='cpu', max_batch_size=max_batch_size, max_wait_ms=0)
+    _engine._activate(adapter)
+
+
+def _run_shard(shard_path, adapter, decoding_profile, max_new_tokens):
+    start = time.perf_counter()
+    with open(shard_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    entries = _engine.submit(adapter, records, decoding_profile=decoding_profile, max_new_tokens=max_new_tokens).result()
+    return entries, time.perf_counter() - start
+
+
+def shard_sort_key(path):
+    match = Path(path).stem.rsplit('part', 1)
+    return int(match[1]) if len(match) == 2 and match[1].isdigit() else extract_file_number(Path(path).name)
+
+
+def run(shards, output_file, args):
+    """
+    Runs every shard on a process pool and streams the validated entries into one submission file.
+
+    Args:
+        shards (list): Shard paths, merged in this order
+        output_file (str): Path of the merged submission JSON
+        args (argparse.Namespace): Parsed command-line options
+
+    Returns:
+        list: Error messages for shards or entries that could not be merged
+    """
+    ctx = multiprocessing.get_context('spawn')
+    make_pool = lambda: ProcessPoolExecutor(
+        max_workers=args.num_workers, mp_context=ctx, initializer=_init_worker,
+        initargs=(args.model_file, args.ckpt_dir, args.adapter, args.threads_per_worker, args.max_batch_size))
+
+    attempts = {shard: 0 for shard in shards}
+    results = {}
+    errors = []
+    next_to_write = 0
+    written = 0
+    completed = 0
+    seen_uris = set()
+
+    with open(output_file, 'w', encoding='utf-8') as out:
+        out.write("[")
+
+        def write_ready():
+            # Entries stream out in shard order as soon as every earlier shard is done.
+            nonlocal next_to_write, written
+            while next_to_write < len(shards) and shards[next_to_write] in results:
+                shard = shards[next_to_write]
+                for i, entry in enumerate(results.pop(shard) or [], 1):
+                    try:
+                        fixed_entry = validate_and_fix_entry(entry, Path(shard).name, i)
+                    except JSONValidationError as e:
+                        errors.append(str(e))
+                        continue
+                    if fixed_entry['uri'] in seen_uris:
+                        errors.append(f"Skipping duplicate URI {fixed_entry['uri']} in {Path(shard).name}, entry {i}")
+                        continue
+                    seen_uris.add(fixed_entry['uri'])
+                    out.write(("," if written else "") + "\n" + json.dumps(fixed_entry, indent=2, ensure_ascii=False))
+                    written += 1
+                out.flush()
+                next_to_write += 1
+
+        pending = list(shards)
+        while pending:
+            pool = make_pool()
+            futures = {}
+            for shard in pending:
+                attempts[shard] += 1
+                futures[pool.submit(_run_shard, shard, args.adapter, args.decoding_profile, args.max_new_tokens)] = shard
+            pending = []
+            try:
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        entries, seconds = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        if attempts[shard] <= args.max_retries:
+                            print(f"{Path(shard).name} failed (attempt {attempts[shard]}): {e}; retrying")
+                            pending.append(shard)
+                        else:
+                            errors.append(f"{Path(shard).name} failed after {attempts[shard]} attempts: {e}")
+                            results[shard] = None
+                            write_ready()
+                        continue
+                    results[shard] = entries
+                    completed += 1
+                    print(f"[{completed}/{len(shards)}] {Path(shard).name}: {len(entries)} entries in {seconds:.1f}s (attempt {attempts[shard]})")
+                    write_ready()
+            except BrokenProcessPool as e:
+                # A worker died; rebuild the pool and resubmit every shard that has not finished.
+                done = set(results) | set(shards[:next_to_write])
+                retry = [s for s in futures.values() if s not in done and s not in pending]
+                for shard in retry:
+                    if attempts[shard] <= args.max_retries:
+                        pending.append(shard)
+                    else:
+                        errors.append(f"{Path(shard).name} failed after {attempts[shard]} attempts: {e}")
+                        results[shard] = None
+                print(f"Worker pool broke ({e}); resubmitting {len(pending)} shards")
+                write_ready()
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        write_ready()
+        out.write("\n]\n")
+
+    print(f"\nMerged {written} entries from {len(shards)} shards into {output_file}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run inference over test_no_label_split shards on a process pool.")
+    parser.add_argument('--shard_dir', type=str, default='../test_no_label_split')
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument("--ckpt_dir", type=str, required=True)
+    parser.add_argument("--adapter", type=str, required=True, help="adapter checkpoint name under --ckpt_dir")
+    parser.add_argument('--output_file', type=str, default='./generated/submission.json')
+    parser.add_argument("--threads_per_worker", type=int, default=4)
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="defaults to cpu_count // threads_per_worker")
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--max_retries", type=int, default=2)
+    parser.add_argument('--decoding_profile', type=str, default='full-beam')
+    parser.add_argument('--max_new_tokens', type=int, default=500)
+    args = parser.parse_args()
+
+    shards = sorted((str(p) for p in Path(args.shard_dir).glob("*_part*.json")), key=shard_sort_key)
+    if not shards:
+        parser.error(f"No *_part*.json shards found in {args.shard_dir}")
+    if args.num_workers is None:
+        args.num_workers = max(1, (os.cpu_count() or 1) // args.threads_per_worker)
+    args.num_workers = min(args.num_workers, len(shards))
+    os.makedirs(os.path.dirname(args.output_file) or '.', exist_ok=True)
+    print(f"{len(shards)} shards, {args.num_workers} workers x {args.threads_per_worker} threads")
+
+    errors = run(shards, args.output_file, args)
+    if errors:
+        print("\nWarnings/Errors encountered:")
+        for error in errors:
+            print(f"- {error}")
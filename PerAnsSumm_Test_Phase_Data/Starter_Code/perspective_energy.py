@@ -0,0 +1,131 @@
+import itertools
+import numpy as np
+import torch
+
+# Label order of the RoBERTa perspective classifier.
+PERSPECTIVES = ["EXPERIENCE", "SUGGESTION", "INFORMATION", "CAUSE", "QUESTION"]
+
+START_PHRASES = {
+    "EXPERIENCE": "In user's experience…",
+    "SUGGESTION": "It is suggested",
+    "INFORMATION": "For information purposes",
+    "CAUSE": "Some of the causes",
+    "QUESTION": "It is inquired",
+}
+
+TONE_WORDS = {
+    "EXPERIENCE": ["Personal", "Narrative", "Introspective", "Exemplary", "Insightful", "Emotional"],
+    "SUGGESTION": ["Advisory", "Recommending", "Cautioning", "Prescriptive", "Guiding","Prescriptive"],
+    "INFORMATION": ["Clinical", "Scientific","Informative", "Educational","Factual", "Informing","Academic","Analytical"],
+    "CAUSE": ["Diagnostic", "Explanatory", "Causal","Due to", "Resulting from", "Attributable to" ],
+    "QUESTION": ["Inquiry", "Rhetorical", "Exploratory Questioning", "Clarifying Inquiry", "Problem-Solving Deliberation"],
+}
+
+
+def rouge_unigrams(text):
+    """Unigram set of ``text`` segmented exactly like ``Rouge().get_scores`` from the ``rouge`` package."""
+    sentences = [" ".join(part.split()) for part in text.lower().split(".") if len(part) > 0]
+    return set(itertools.chain(*[sentence.split(" ") for sentence in sentences]))
+
+
+class StartPhraseScorer:
+    """ROUGE-1 F of the first ``n_words`` words of each summary against a fixed set of phrases.
+
+    The phrases are turned into binary unigram vectors once; a batch of summaries is then scored
+    against all of them with a single matrix product. The ``rouge`` package (with its default
+    ``exclusive=True``) also counts unigrams as sets, so the float64 results equal
+    ``Rouge().get_scores(start.lower(), phrase.lower())[0]["rouge-1"]["f"]`` to within 1e-12.
+    A summary whose opening has no words scores 0 where the ``rouge`` package would raise.
+    """
+
+    def __init__(self, phrases, n_words=4):
+        self.phrases = phrases
+        self.n_words = n_words
+        phrase_unigrams = [rouge_unigrams(phrase) for phrase in phrases]
+        self.vocab = {token: i for i, token in enumerate(sorted(set().union(*phrase_unigrams)))}
+        self.phrase_matrix = np.zeros((len(phrases), len(self.vocab)), dtype=np.float64)
+        for row, unigrams in enumerate(phrase_unigrams):
+            self.phrase_matrix[row, [self.vocab[token] for token in unigrams]] = 1.0
+        self.phrase_counts = self.phrase_matrix.sum(axis=1)
+
+    def score(self, summaries):
+        summary_matrix = np.zeros((len(summaries), len(self.vocab)), dtype=np.float64)
+        summary_counts = np.zeros(len(summaries), dtype=np.float64)
+        for row, summary in enumerate(summaries):
+            unigrams = rouge_unigrams(' '.join(summary.split()[:self.n_words]))
+            summary_counts[row] = len(unigrams)
+            summary_matrix[row, [self.vocab[token] for token in unigrams if token in self.vocab]] = 1.0
+
+        overlap = summary_matrix @ self.phrase_matrix.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(summary_counts[:, None] > 0, overlap / summary_counts[:, None], 0.0)
+            recall = np.where(self.phrase_counts[None, :] > 0, overlap / self.phrase_counts[None, :], 0.0)
+        return 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+
+
+class PerspectiveScorer:
+    """Scores whole batches of generated summaries against the five perspectives.
+
+    E(X) = alpha * Ep + beta * Es + gamma * Et, where Ep is the RoBERTa classifier probability,
+    Es the ROUGE-1 F of the summary opening against the start phrase and Et the BERT cosine
+    similarity to the tone words. The tone-word embeddings never change, so they are computed
+    once here instead of on every step. All scores are tensors of shape (batch, 5) in
+    PERSPECTIVES order.
+    """
+
+    def __init__(self, bert_tokenizer, bert_model, roberta_tokenizer, roberta_model, device, alpha=0.7, beta=0.3, gamma=0.5):
+        self.bert_tokenizer = bert_tokenizer
+        self.bert_model = bert_model
+        self.roberta_tokenizer = roberta_tokenizer
+        self.roberta_model = roberta_model
+        self.device = device
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.start_phrase_scorer = StartPhraseScorer([START_PHRASES[label] for label in PERSPECTIVES])
+        self.tone_embeddings = self.bert_embeddings([' '.join(TONE_WORDS[label]) for label in PERSPECTIVES])
+
+    @torch.no_grad()
+    def bert_embeddings(self, texts):
+        inputs = self.bert_tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt").to(self.device)
+        hidden = self.bert_model(**inputs).last_hidden_state
+        # Mean over real tokens only, so padding inside the batch does not change a text's embedding.
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        return (hidden * mask).sum(dim=1) / mask.sum(dim=1)
+
+    @torch.no_grad()
+    def Ep(self, summaries):
+        inputs = self.roberta_tokenizer(summaries, padding=True, truncation=True, return_tensors="pt").to(self.device)
+        logits = self.roberta_model(**inputs).logits
+        return torch.nn.functional.softmax(logits.float(), dim=-1).cpu()
+
+    def Es(self, summaries):
+        return torch.from_numpy(self.start_phrase_scorer.score(summaries)).float()
+
+    def Et(self, summaries):
+        summary_embeddings = self.bert_embeddings(summaries)
+        similarities = torch.nn.functional.cosine_similarity(summary_embeddings.unsqueeze(1), self.tone_embeddings.unsqueeze(0), dim=-1)
+        return similarities.float().cpu()
+
+    def similarity(self, predictions, references):
+        """Cosine similarity of the BERT embeddings of each prediction and its reference."""
+        return torch.nn.functional.cosine_similarity(self.bert_embeddings(predictions), self.bert_embeddings(references), dim=-1).float().cpu()
+
+    def energy(self, summaries):
+        summaries = [summary if summary.strip() else 'None' for summary in summaries]
+        return self.alpha * self.Ep(summaries) + self.beta * self.Es(summaries) + self.gamma * self.Et(summaries)
+
+    def probabilities(self, E_X):
+        exp_E_X = torch.exp(-1 / E_X)
+        return exp_E_X / exp_E_X.sum(dim=-1, keepdim=True)
+
+    def score(self, summaries):
+        """Returns (E(X), P(X)) for a batch of summaries, each of shape (batch, 5)."""
+        E_X = self.energy(summaries)
+        return E_X, self.probabilities(E_X)
+
+    def loss(self, summaries, perspectives):
+        """Mean cross-entropy of P(X) against the target perspective of each summary."""
+        _, P_X = self.score(summaries)
+        targets = torch.tensor([PERSPECTIVES.index(perspective.strip()) for perspective in perspectives])
+        return -torch.log(P_X[torch.arange(len(targets)), targets]).mean()
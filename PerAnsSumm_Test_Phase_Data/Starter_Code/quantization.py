@@ -0,0 +1,76 @@
+import resource
+
+QUANTIZE_MODES = ["none", "int8"]
+
+
+def quantize_peft_model(peft_model, mode="int8", skip_modules=("lm_head",)):
+    """
+    Applies dynamic quantization to the linear layers of a loaded PeftModel's foundation model, in place.
+
+    Only the foundation model is quantized. The prefix encoder that produces the prefix-tuning
+    virtual tokens keeps its fp32 weights, and the key/value prefixes it emits are consumed by the
+    attention matmuls, which stay in fp32, so the trained prefixes apply unchanged. Dynamic int8
+    quantization is a CPU-only transform.
+
+    Args:
+        peft_model: Model returned by PeftModel.from_pretrained, already on the CPU and in eval mode
+        mode (str): One of QUANTIZE_MODES; "none" returns the model untouched
+        skip_modules (tuple): Names of linear layers to keep in fp32; the output projection is kept
+            by default because it is usually tied to the input embeddings, so quantizing it adds
+            an int8 copy without freeing the shared fp32 weights
+
+    Returns:
+        The same PeftModel
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode {mode}; choose from {', '.join(QUANTIZE_MODES)}")
+    if mode == "none":
+        return peft_model
+    import torch
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+    base_model = peft_model.get_base_model()
+    qconfig_spec = {name: default_dynamic_qconfig for name, module in base_model.named_modules()
+                    if isinstance(module, torch.nn.Linear) and name.split(".")[-1] not in skip_modules}
+    # In place, so the PeftModel keeps wrapping the quantized modules.
+    quantize_dynamic(base_model, qconfig_spec, dtype=torch.qint8, inplace=True)
+    return peft_model
+
+
+def model_size_mb(model):
+    # Parameters and buffers; quantized layers keep their int8 weights in packed params instead.
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+    size = sum(t.numel() * t.element_size() for t in model.state_dict().values() if isinstance(t, torch.Tensor))
+    for module in model.modules():
+        if isinstance(module, DynamicLinear):
+            weight, bias = module._weight_bias()
+            size += weight.int_repr().numel() + (bias.numel() * bias.element_size() if bias is not None else 0)
+    return size / 2**20
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux. The peak includes loading the fp32 checkpoint,
+    # which happens before quantization, so compare steady-state memory with rss_mb.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def rss_mb():
+    # Current resident set size; falls back to the peak where /proc is unavailable.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def add_quantization_args(parser, default_device="cuda"):
+    parser.add_argument("--device", type=str, default=default_device)
+    parser.add_argument("--quantize", type=str, default="none", choices=QUANTIZE_MODES,
+                        help="int8: dynamic int8 quantization of the foundation model's linear layers (CPU only)")
+    parser.add_argument("--num_threads", type=int, default=None, help="torch intra-op threads on CPU")
+
+
+def check_quantization_args(parser, args):
+    if args.quantize != "none" and args.device != "cpu":
+        parser.error(f"--quantize {args.quantize} requires --device cpu")
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+
+CATEGORIES = ['EXPERIENCE', 'INFORMATION', 'CAUSE', 'SUGGESTION', 'QUESTION']
+
+
+class ResultWriter:
+    """Buffers generated rows column-wise and flushes them to disk in chunks.
+
+    Supported formats:
+        csv        - one row per example, with a header row
+        jsonl      - one JSON object per example
+        submission - PerAnsSumm submission JSON (see sample_submission.json), rendered on close()
+                     from a ``<output_file>.partial.jsonl`` sidecar that holds the flushed rows
+
+    Every row carries the dataset INDEX of its source record, so a resumed run can skip the
+    records that were already flushed regardless of the order they were generated in.
+    """
+
+    COLUMNS = ['INDEX', 'URI', 'PERSPECTIVE', 'PREDICTED', 'ACTUAL OUTPUT', 'INPUT']
+
+    def __init__(self, output_file, output_format='csv', flush_every=64, resume=False):
+        if output_format not in ('csv', 'jsonl', 'submission'):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_file = output_file
+        self.output_format = output_format
+        self.flush_every = flush_every
+        self.rows_path = output_file + '.partial.jsonl' if output_format == 'submission' else output_file
+        self.columns = {column: [] for column in self.COLUMNS}
+
+        directory = os.path.dirname(self.rows_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not resume and os.path.exists(self.rows_path):
+            os.remove(self.rows_path)
+        self.done = self._read_done_indices()
+        if self.output_format == 'csv' and not os.path.exists(self.rows_path):
+            with open(self.rows_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(self.COLUMNS)
+
+    def _read_done_indices(self):
+        if not os.path.exists(self.rows_path):
+            return set()
+        with open(self.rows_path, 'r', newline='', encoding='utf-8') as f:
+            if self.output_format == 'csv':
+                return {int(row['INDEX']) for row in csv.DictReader(f)}
+            return {json.loads(line)['INDEX'] for line in f if line.strip()}
+
+    def __len__(self):
+        return len(self.columns['INDEX'])
+
+    def add(self, index, record, predicted):
+        self.columns['INDEX'].append(index)
+        self.columns['URI'].append(record.get('uri'))
+        self.columns['PERSPECTIVE'].append(record.get('Perspective'))
+        self.columns['PREDICTED'].append(predicted)
+        self.columns['ACTUAL OUTPUT'].append(record.get('Summary'))
+        self.columns['INPUT'].append(record.get('answers'))
+        if len(self) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not len(self):
+            return
+        rows = zip(*(self.columns[column] for column in self.COLUMNS))
+        with open(self.rows_path, 'a', newline='', encoding='utf-8') as f:
+            if self.output_format == 'csv':
+                csv.writer(f).writerows(
+                    [index, uri, perspective, predicted, actual, json.dumps(answers, ensure_ascii=False)]
+                    for index, uri, perspective, predicted, actual, answers in rows
+                )
+            else:
+                f.writelines(json.dumps(dict(zip(self.COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(self.columns['INDEX'])
+        self.columns = {column: [] for column in self.COLUMNS}
+
+    def close(self):
+        self.flush()
+        if self.output_format == 'submission':
+            self._write_submission()
+
+    def _write_submission(self):
+        entries = {}
+        with open(self.rows_path, 'r', encoding='utf-8') as f:
+            rows = sorted((json.loads(line) for line in f if line.strip()), key=lambda row: row['INDEX'])
+        for row in rows:
+            uri = row['URI']
+            if uri not in entries:
+                entries[uri] = {
+                    'uri': uri,
+                    'spans': {category: [] for category in CATEGORIES},
+                    'summaries': {category: "" for category in CATEGORIES},
+                }
+            perspective = (row['PERSPECTIVE'] or '').strip()
+            if perspective in CATEGORIES:
+                entries[uri]['summaries'][perspective] = row['PREDICTED']
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            json.dump(list(entries.values()), f, indent=2, ensure_ascii=False)
@@ -0,0 +1,29 @@
+from rouge import Rouge
+
+ROUGE_METRICS = ["rouge-1", "rouge-2", "rouge-l"]
+
+
+def has_words(text):
+    # The rouge package raises on a hypothesis or reference with no words (e.g. "..."), not only on an empty one.
+    return any(c.isalnum() for c in text)
+
+
+def scorable_pairs(hypotheses, references):
+    """
+    Keeps the (hypothesis, reference) pairs that ROUGE can score, i.e. where both sides contain a word.
+
+    Args:
+        hypotheses (list): Generated texts
+        references (list): Reference texts, aligned with hypotheses
+
+    Returns:
+        list: (hypothesis, reference) tuples
+    """
+    return [(h, r) for h, r in zip(hypotheses, references) if has_words(h) and has_words(r)]
+
+
+def rouge_f(hypotheses, references):
+    # Average ROUGE F1 over the scorable pairs; 0.0 for every metric when none are left.
+    pairs = scorable_pairs(hypotheses, references)
+    scores = Rouge().get_scores([h for h, _ in pairs], [r for _, r in pairs], avg=True) if pairs else None
+    return {name: scores[name]["f"] if scores else 0.0 for name in ROUGE_METRICS}
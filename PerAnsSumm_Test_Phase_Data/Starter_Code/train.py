@@ -1,188 +1,119 @@
 import json
 import argparse 
-from transformers.file_utils import PushToHubMixin
-from transformers import BartTokenizer, BartForConditionalGeneration,GPT2LMHeadModel,AutoModelForSeq2SeqLM,AutoTokenizer,BertTokenizer,BertModel
-from peft import get_peft_config, get_peft_model, get_peft_model_state_dict, PrefixTuningConfig, TaskType
 import sys
 sys.path.insert(0, './') 
-from train_dataloader import *
-from transformers import Seq2SeqTrainer, Seq2SeqTrainingArguments, DataCollatorForSeq2Seq, AdamW, get_linear_schedule_with_warmup, RobertaForSequenceClassification, RobertaTokenizer
-from tqdm import tqdm
-import numpy as np
+from decoding import add_decoding_args, generation_kwargs
 import os
-import torch
-from scipy.spatial.distance import cosine
+from datetime import timedelta
 import math
-from rouge import Rouge
-import numpy as np
+import resource
+import time
+import random
 import warnings
+from pathlib import Path
 warnings.filterwarnings("ignore")
-from rouge import Rouge
-import numpy as np
-import pandas as pd
 
 
     
-def get_bert_embedding(text):
-        inputs = bert_tokenizer(text, return_tensors="pt", truncation=True, max_length=512).to(device)
-        outputs = bert_model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).squeeze()
-
-
-def calculate_rouge_score_for_each_phrase(predictions, references):
-        rouge = Rouge()
-        rouge_l_f1_scores = []
-
-        for prediction, reference in zip(predictions, references):
-            scores = rouge.get_scores(prediction.lower(), reference.lower())[0]
-            rouge_l_f1 = scores["rouge-1"]["f"]
-            rouge_l_f1_scores.append(rouge_l_f1)
-
-        return rouge_l_f1_scores
-
-def score_all_phrases(summary, phrases):
-        start_of_summary = ' '.join(summary.split()[:4])
-
-    
-        predictions = [start_of_summary] * len(phrases)
-        references = phrases
-
-        rouge_l_f1_results = calculate_rouge_score_for_each_phrase(predictions, references)
-
-        phrase_scores = dict(zip(phrases, rouge_l_f1_results))
-
-        return phrase_scores
-
-def Ep(generated_summary):
-
-        inputs = roberta_tokenizer(generated_summary, padding=True, truncation=True, return_tensors="pt").to(device)
-
-    
-        with torch.no_grad():
-            outputs = roberta_model(**inputs)
-            probabilities = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            predictions = outputs.logits.argmax(dim=-1)
-
-        class_labels = {0: "EXPERIENCE", 1: "SUGGESTION", 2: "INFORMATION", 3: "CAUSE", 4: "QUESTION"}
-        predicted_label = class_labels[predictions[0].item()]
-
-        final ={}
-        for i in range(0,5):
-            final[class_labels[i]] = probabilities[0][i].cpu().numpy().item()
-
-        return final
-
-
-def Es(generated_summary):
-        phrases = [
-            "In user's experience…",
-            "It is suggested",
-            "For information purposes",
-            "Some of the causes",
-            "It is inquired"
-        ]
-        
-        phrase_scores = score_all_phrases(generated_summary, phrases)
-        return phrase_scores
-
-def Et(generated_summary):
-        l_sugg =  ["Advisory", "Recommending", "Cautioning", "Prescriptive", "Guiding","Prescriptive"]
-        l_exp = ["Personal", "Narrative", "Introspective", "Exemplary", "Insightful", "Emotional"]
-        l_info =  ["Clinical", "Scientific","Informative", "Educational","Factual", "Informing","Academic","Analytical"]
-        l_cause =  ["Diagnostic", "Explanatory", "Causal","Due to", "Resulting from", "Attributable to" ]
-        l_qs =  ["Inquiry", "Rhetorical", "Exploratory Questioning", "Clarifying Inquiry", "Problem-Solving Deliberation"]
-
-
-        summary_embedding = get_bert_embedding(generated_summary)
-
-        cosine_similarities = {}
-
-        for label, word_list in zip(['sugg', 'exp', 'info', 'cause', 'qs'], [l_sugg, l_exp, l_info, l_cause, l_qs]):
-            combined_text = ' '.join(word_list)
-            word_embedding = get_bert_embedding(combined_text)
-            similarity = 1 - cosine(summary_embedding.cpu().detach().numpy(), word_embedding.cpu().detach().numpy())
-            cosine_similarities[label] = similarity
-
-        return cosine_similarities
-
-def compute_custom_loss(model, input_text, input_attention, perspective):
-        model.eval()
-        outputs = model.generate(input_ids=input_text,attention_mask=input_attention,num_beams=5, max_new_tokens=100,temperature=0.9)
-        generated_summary = tokenizer.decode(outputs[0])
-        if len(generated_summary) <= 0:
-            generated_summary = 'None'
-       
-        Ep_dict = Ep(generated_summary)
-        Es_dict = Es(generated_summary)
-        Et_dict = Et(generated_summary)
-
-
-        alpha = 0.7  
-        beta = 0.3   
-        gamma = 0.5  
-
-        E_X = {
-            "EXPERIENCE": alpha * Ep_dict["EXPERIENCE"] + beta * Es_dict["In user's experience…"] + gamma * Et_dict['exp'],
-            "SUGGESTION": alpha * Ep_dict["SUGGESTION"] + beta * Es_dict["It is suggested"] + gamma * Et_dict['sugg'],
-            "INFORMATION": alpha * Ep_dict["INFORMATION"] + beta * Es_dict["For information purposes"] + gamma * Et_dict['info'],
-            "CAUSE": alpha * Ep_dict["CAUSE"] + beta * Es_dict["Some of the causes"] + gamma * Et_dict['cause'],
-            "QUESTION": alpha * Ep_dict["QUESTION"] + beta * Es_dict["It is inquired"] + gamma * Et_dict['qs']
-        }
-
-        # Compute the exponential of E(X) for normalization
-        exp_E_X = {k: math.exp(-1/(v)) for k, v in E_X.items()}
-        
-        # Compute the sum of the exponentials for normalization
-        Z = sum(exp_E_X.values())
-
-        # Calculate P(X) for each perspective
-        P_X = {k: v / Z for k, v in exp_E_X.items()}
-        
-
-        Y = {"EXPERIENCE": 0, "SUGGESTION": 0, "INFORMATION": 0, "CAUSE": 0, "QUESTION": 0}
-        Y[perspective[0]] = 1
-
-        P_X_tensor = torch.tensor([P_X[k] for k in P_X])
-        Y_tensor = torch.tensor([Y[k] for k in Y])
-
-        loss = -torch.sum(Y_tensor * torch.log(P_X_tensor))
+def generate_summaries(model, input_text, input_attention, perspective=None):
+        decoding = generation_kwargs(args.decoding_profile, args.max_new_tokens, perspective if args.perspective_budget else None, args.length_penalty)
+        outputs = model.generate(input_ids=input_text,attention_mask=input_attention,**decoding)
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+def autocast():
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16, enabled=args.bf16)
+
+def peak_memory_mb():
+        if torch.device(device).type == 'cuda':
+            return torch.cuda.max_memory_allocated() / 2**20
+        # ru_maxrss is reported in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def is_main_process():
+        return not dist.is_initialized() or dist.get_rank() == 0
+
+def all_reduce_gradients(model):
+        # Only the prefix parameters are trainable, so their gradients go over the wire as one small flat tensor.
+        params = [p for p in model.parameters() if p.requires_grad]
+        flat = torch.cat([(p.grad if p.grad is not None else torch.zeros_like(p)).reshape(-1) for p in params])
+        dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+        flat /= dist.get_world_size()
+        offset = 0
+        for p in params:
+            p.grad = flat[offset:offset + p.numel()].view_as(p).clone()
+            offset += p.numel()
+
+def compute_custom_loss(model, input_text, input_attention, perspective, generated_summaries=None):
+        # Pass generated_summaries to reuse a generation that was already run for this batch.
+        if generated_summaries is None:
+            was_training = model.training
+            model.eval()
+            generated_summaries = generate_summaries(model, input_text, input_attention, perspective)
+            model.train(was_training)
+
+        # E(X) and P(X) for the whole batch in one forward pass per scoring model.
+        loss = perspective_scorer.loss(generated_summaries, perspective)
         return loss 
 
 
-            
+def validation_metrics(gen, actual):
+        pairs = scorable_pairs(gen, actual)
+        metrics = {"num_examples": len(gen), "num_scored": len(pairs)}
+        if not pairs:
+            return metrics
+        hyps, refs = zip(*pairs)
+        rouge_scores = Rouge().get_scores(list(hyps), list(refs), avg=True)
+        for name in ROUGE_METRICS:
+            metrics[name] = rouge_scores[name]["f"]
+        # BERTScore-style similarity: cosine of mean-pooled BERT embeddings of prediction and reference.
+        metrics["bert_similarity"] = perspective_scorer.similarity(list(hyps), list(refs)).mean().item()
+        return metrics
 
 
-def validation(valid_dataloader, model, VALID_BATCH_SIZE, optimizer, scheduler):
+def validation(valid_dataloader, model, VALID_BATCH_SIZE, optimizer, scheduler, epoch=None, report_dir=None):
         
             print("Validation processing...")
             model.eval()    
             valid_losses = []
             gen = []
             actual =[]
+            perspectives = []
             with torch.no_grad():
                 for i,batch in enumerate(tqdm(valid_dataloader)):
                     
                     input_ids = batch['input_ids'].to(device)
                     attention_mask = batch['attention_mask'].to(device)
-                    labels = batch['input_ids'].to(device)
+                    labels = batch['labels'].to(device)
                     
-                    output = model(input_ids= input_ids,attention_mask=attention_mask,labels=labels)
+                    with autocast():
+                        output = model(input_ids= input_ids,attention_mask=attention_mask,labels=labels)
                 
-                    custom_loss = compute_custom_loss(model,input_ids,attention_mask, batch["perspective"])
+                    # Generate once and reuse it for both the perspective loss and the metrics.
+                    generated_summaries = generate_summaries(model, input_ids, attention_mask, batch["perspective"])
+                    custom_loss = compute_custom_loss(model,input_ids,attention_mask, batch["perspective"], generated_summaries)
                     loss = output.loss + custom_loss
 
-                   
-
-                    outputs = model.generate(input_ids=input_ids,attention_mask=attention_mask,num_beams=5, max_new_tokens=100,temperature=0.9)
-                    generated_summary = tokenizer.decode(outputs[0])
-                    gen.append(generated_summary)
-                    actual.append(batch['Summary'])
-                  
+                    gen.extend(generated_summaries)
+                    actual.extend(batch['Summary'])
+                    perspectives.extend(batch['perspective'])
                     
                     print(f"_________________ValidBatch: {i}/{len(valid_dataloader)} || ValidLoss: {loss}_____________________")
                     valid_losses.append(loss.item()) 
                     
             valid_loss = np.mean(valid_losses) if len(valid_losses) > 0 else 0.0  
+
+            metrics = validation_metrics(gen, actual)
+            metrics["valid_loss"] = float(valid_loss)
+            print(f"Validation metrics for epoch {epoch}: {metrics}")
+            if report_dir is not None:
+                os.makedirs(report_dir, exist_ok=True)
+                report = {
+                    "epoch": epoch,
+                    "metrics": metrics,
+                    "examples": [{"perspective": p, "generated": g, "actual": a} for p, g, a in zip(perspectives, gen, actual)],
+                }
+                with open(os.path.join(report_dir, f"validation_epoch={epoch}.json"), 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2, ensure_ascii=False)
             return valid_loss 
 
 if __name__=="__main__":
@@ -205,11 +136,69 @@ if __name__=="__main__":
         parser.add_argument("--ckpt_dir", type=str, default=None)
         parser.add_argument("--ckpt_name", type=str, default=None)
         parser.add_argument("--device", type=str, default='cuda')
+        parser.add_argument("--cache_dir", type=str, default=None,
+                        help="pre-tokenize the datasets once and cache them in this directory")
+        parser.add_argument("--dynamic_padding", action="store_true",
+                        help="pad each batch to its longest item instead of max_length")
+        parser.add_argument("--group_by_length", action="store_true",
+                        help="batch together examples of similar length")
+        parser.add_argument("--valid_subsample", type=int, default=None,
+                        help="validate on a fixed random subsample of this many validation examples")
+        parser.add_argument("--validate_every", type=int, default=1,
+                        help="run validation every N epochs (always on the last epoch)")
+        add_decoding_args(parser, default_profile="full-beam", default_max_new_tokens=100)
+        parser.add_argument("--bf16", action="store_true",
+                        help="run the forward passes under bfloat16 autocast")
+        parser.add_argument("--gradient_accumulation_steps", type=int, default=1)
+        parser.add_argument("--gradient_checkpointing", action="store_true",
+                        help="recompute activations of the frozen foundation model in the backward pass")
+        parser.add_argument("--distributed", action="store_true",
+                        help="data-parallel training over torch.distributed (gloo); launch with torchrun")
+        parser.add_argument("--num_threads", type=int, default=None,
+                        help="torch intra-op threads per process")
+        parser.add_argument("--save_every_steps", type=int, default=None,
+                        help="also checkpoint as 'last' every N optimizer steps")
+        parser.add_argument("--keep_top_k", type=int, default=3,
+                        help="number of best checkpoints (by validation loss) to keep")
 
         args = parser.parse_args()
+        for path in [args.train_file, args.valid_file]:
+            if not os.path.exists(path):
+                parser.error(f"file not found: {path}")
+        if args.num_epochs is None or args.num_epochs < 1:
+            parser.error("--num_epochs must be a positive integer")
+        if args.ckpt_dir is None:
+            parser.error("--ckpt_dir is required")
+        if args.gradient_accumulation_steps < 1 or args.validate_every < 1:
+            parser.error("--gradient_accumulation_steps and --validate_every must be at least 1")
+
+        # Heavy imports are deferred until the arguments are valid, so --help and argument errors return immediately.
+        import numpy as np
+        import torch
+        import torch.distributed as dist
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, BertTokenizer, BertModel, AdamW, get_linear_schedule_with_warmup, RobertaForSequenceClassification, RobertaTokenizer
+        from peft import get_peft_model, PrefixTuningConfig, TaskType
+        from tqdm import tqdm
+        from rouge import Rouge
+        from rouge_metrics import ROUGE_METRICS, scorable_pairs
+        from train_dataloader import *
+        from perspective_energy import PerspectiveScorer
+        from checkpointing import CheckpointManager, load_checkpoint, rng_state, set_rng_state
+        # corpus_store.py lives one directory up, next to json_split.py; it pulls in numpy.
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        from corpus_store import load_corpus
 
         
         device = args.device
+        if args.distributed:
+            # Rank 0 validates while the other ranks wait at a barrier, so allow for long validation passes.
+            dist.init_process_group(backend="gloo", timeout=timedelta(hours=6))
+            if device == 'cuda':
+                device = f"cuda:{os.environ.get('LOCAL_RANK', 0)}"
+        rank = dist.get_rank() if args.distributed else 0
+        world_size = dist.get_world_size() if args.distributed else 1
+        if args.num_threads is not None:
+            torch.set_num_threads(args.num_threads)
 
         bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
         bert_model = BertModel.from_pretrained('bert-base-uncased').to(device)
@@ -222,15 +211,20 @@ if __name__=="__main__":
                 ckpt = torch.load(ckpt_path)
                 roberta_model.load_state_dict(ckpt['model_state_dict'])
                 print("The inference will start with the specified checkpoint.")
+        perspective_scorer = PerspectiveScorer(bert_tokenizer, bert_model, roberta_tokenizer, roberta_model, device)
 
 
 
         TRAIN_BATCH_SIZE = args.batch_size_train
-        with open(args.train_file, 'r') as json_file:
-            train_data = json.load(json_file)
+        # Either a JSON file or a corpus store directory from corpus_store.py; raw_text is never used.
+        train_data = load_corpus(args.train_file, exclude=['raw_text'])
         VALID_BATCH_SIZE = args.batch_size_valid
-        with open(args.valid_file, 'r') as json_file:
-            valid_data = json.load(json_file)
+        valid_data = load_corpus(args.valid_file, exclude=['raw_text'])
+        valid_file = args.valid_file
+        if args.valid_subsample is not None and args.valid_subsample < len(valid_data):
+            # A fixed seed keeps the subsample identical across epochs and runs.
+            valid_data = random.Random(0).sample(valid_data, args.valid_subsample)
+            valid_file = None
         LR = args.learning_rate
         WARMUP_STEPS = args.warmup_steps
         EPOCHS = args.num_epochs
@@ -240,6 +234,11 @@ if __name__=="__main__":
        
         model = AutoModelForSeq2SeqLM.from_pretrained(args.model_file)
         tokenizer = AutoTokenizer.from_pretrained(args.model_file)
+        if args.gradient_checkpointing:
+            # Non-reentrant checkpointing lets gradients reach the prefix parameters even though the
+            # frozen foundation model's inputs do not require grad.
+            model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+            model.config.use_cache = False
        
 
 
@@ -252,88 +251,124 @@ if __name__=="__main__":
         peft_model = get_peft_model(model, peft_config)
         peft_model.print_trainable_parameters()
         model = peft_model
+        # On the device before the optimizer exists, so a resumed optimizer state is loaded next to its params.
+        model.to(device)
 
                 
-        train_dataset = CustomDataset(train_data,tokenizer)
-        eval_dataset = CustomDataset(valid_data,tokenizer)
-        train_dataloader, eval_dataloader = create_dataloader(train_dataset, eval_dataset,  VALID_BATCH_SIZE, TRAIN_BATCH_SIZE)
+        train_dataset = CustomDataset(train_data,tokenizer, cache_dir=args.cache_dir, data_file=args.train_file, pad_to_max_length=not args.dynamic_padding)
+        eval_dataset = CustomDataset(valid_data,tokenizer, cache_dir=args.cache_dir, data_file=valid_file, pad_to_max_length=not args.dynamic_padding)
+        train_dataloader, eval_dataloader = create_dataloader(train_dataset, eval_dataset,  TRAIN_BATCH_SIZE, VALID_BATCH_SIZE, group_by_length=args.group_by_length, num_replicas=world_size, rank=rank)
+        train_sampler = train_dataloader.batch_sampler if args.group_by_length else train_dataloader.sampler
         
         # Define optimizer and learning rate scheduler
+        ACCUMULATION_STEPS = args.gradient_accumulation_steps
+        # The scheduler advances once per optimizer step, i.e. once per ACCUMULATION_STEPS batches.
+        num_update_steps_per_epoch = math.ceil(len(train_dataloader) / ACCUMULATION_STEPS)
+        print(f"Effective batch size: {TRAIN_BATCH_SIZE * ACCUMULATION_STEPS * world_size} ({TRAIN_BATCH_SIZE} x {ACCUMULATION_STEPS} accumulation steps x {world_size} processes), "
+              f"{num_update_steps_per_epoch * EPOCHS} optimizer steps")
         optimizer = AdamW(model.parameters(), lr=LR)
-        scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=WARMUP_STEPS, num_training_steps=len(train_dataloader) * EPOCHS)
+        scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=WARMUP_STEPS, num_training_steps=num_update_steps_per_epoch * EPOCHS)
 
+        num_batches = len(train_dataloader)
+        resume_step = 0
+        global_step = 0
         if args.ckpt_name is not None:
                 ckpt_path = f"{args.ckpt_dir}/{args.ckpt_name}.ckpt"
                 print("_________ckpt_path___________",ckpt_path)
                 if os.path.exists(ckpt_path):
                 
                     print("Loading the trained checkpoint...")
-                    ckpt = torch.load(ckpt_path)
-                    model.load_state_dict(ckpt['model_state_dict'])
+                    ckpt = load_checkpoint(ckpt_path, model, optimizer, scheduler, device=device)
         
                     print(f"The training restarts with the specified checkpoint: {args.ckpt_name}.ckpt.")
-                    optimizer.load_state_dict(ckpt['optim_state_dict'])
-                    scheduler.load_state_dict(ckpt['sched_state_dict'])
-                    loss = ckpt['loss']
-                    last_epoch = ckpt['epoch']   
+                    best_loss = ckpt.get('best_loss', best_loss)
+                    # Keeps the --save_every_steps cadence aligned with the run that wrote the checkpoint.
+                    global_step = ckpt.get('global_step', 0)
+                    if ckpt['step'] >= num_batches:
+                        last_epoch = ckpt['epoch']
+                    else:
+                        # Preempted mid-epoch: replay that epoch's data order and skip the batches already done.
+                        last_epoch = ckpt['epoch'] - 1
+                        resume_step = ckpt['step']
+                        print(f"Resuming epoch {ckpt['epoch']} after batch {resume_step}/{num_batches}.")
                 else:
                     print(f"Cannot find the specified checkpoint {ckpt_path}.")
     
         start_epoch = last_epoch+1
-        num_batches = len(train_dataloader)
+        if start_epoch > EPOCHS:
+            parser.error(f"the checkpoint has already completed epoch {last_epoch} of --num_epochs {EPOCHS}; "
+                         f"nothing left to train (the scheduler was planned for {EPOCHS} epochs)")
+        checkpoints = CheckpointManager(args.ckpt_dir, keep_top_k=args.keep_top_k) if is_main_process() else None
 
        
-        model.to(device)
-        # Fine-tuning loop
-        for epoch in range(start_epoch,start_epoch+ EPOCHS):
+        # Fine-tuning loop; a resumed run finishes the planned --num_epochs instead of adding more.
+        for epoch in range(start_epoch, EPOCHS + 1):
             model.train()
+            skip_batches = resume_step if epoch == start_epoch else 0
+            if skip_batches:
+                set_rng_state(ckpt['epoch_rng_state'])
+            # RNG state at the start of the epoch; it fixes the shuffle order if this epoch has to be resumed.
+            epoch_rng_state = rng_state()
+            if hasattr(train_sampler, 'set_epoch'):
+                train_sampler.set_epoch(epoch)
             print(f"#"*50 + f"Epoch: {epoch}" + "#"*50)
             train_losses = []
-            for i,batch in enumerate(tqdm(train_dataloader)):
+            step_times = []
+            optimizer.zero_grad()
+            for i,batch in enumerate(tqdm(train_dataloader, disable=not is_main_process())):
+                if i < skip_batches:
+                    if i + 1 == skip_batches:
+                        set_rng_state(ckpt['rng_state'])
+                    continue
+                step_start = time.perf_counter()
                 
                 input_ids = batch['input_ids'].to(device)
                 attention_mask = batch['attention_mask'].to(device)
                 labels =  batch["labels"].to(device)
                 
-                optimizer.zero_grad()
-                outputs = model(input_ids, attention_mask=attention_mask, labels=labels)
+                with autocast():
+                    outputs = model(input_ids, attention_mask=attention_mask, labels=labels)
                 custom_loss = compute_custom_loss(model,input_ids,attention_mask, batch["perspective"])
              
                 loss = outputs.loss + custom_loss
-                loss.backward()
-                optimizer.step()
-                scheduler.step()
+                (loss / ACCUMULATION_STEPS).backward()
+                if (i + 1) % ACCUMULATION_STEPS == 0 or i + 1 == num_batches:
+                    if world_size > 1:
+                        all_reduce_gradients(model)
+                    optimizer.step()
+                    scheduler.step()
+                    optimizer.zero_grad()
+                    global_step += 1
+                    if checkpoints is not None and args.save_every_steps and global_step % args.save_every_steps == 0 and i + 1 < num_batches:
+                        checkpoints.save_last(model, optimizer, scheduler, epoch, i + 1, epoch_rng_state=epoch_rng_state, best_loss=best_loss, global_step=global_step)
                 train_losses.append(loss.detach())
+                step_times.append(time.perf_counter() - step_start)
 
             train_losses = [loss.item() for loss in train_losses] 
             train_loss = np.mean(train_losses)
+            if world_size > 1:
+                train_loss_tensor = torch.tensor(train_loss, dtype=torch.float64)
+                dist.all_reduce(train_loss_tensor, op=dist.ReduceOp.SUM)
+                train_loss = train_loss_tensor.item() / world_size
+            if not is_main_process():
+                # Checkpointing and validation happen on rank 0 only.
+                dist.barrier()
+                continue
             print(f"Train loss: {train_loss} for epoch : {epoch}")
+            print(f"Mean step time: {np.mean(step_times):.3f}s per batch || Peak memory: {peak_memory_mb():.0f} MB")
             list_loss_train.append(train_loss)
-            model.save_pretrained(f"{args.ckpt_dir}/best_ckpt_epoch={epoch}")
            
-            valid_loss = validation(eval_dataloader, model, VALID_BATCH_SIZE, optimizer, scheduler)
-
-            if valid_loss < best_loss:
-                    best_loss = valid_loss
-                    state_dict = {
-                        'model_state_dict': model.state_dict(),
-                        'optim_state_dict': optimizer.state_dict(),
-                        'sched_state_dict': scheduler.state_dict(),
-                        'loss': best_loss,
-                        'epoch': last_epoch
-                    }
-                
-                    model.save_pretrained(f"{args.ckpt_dir}/best_ckpt_epoch={epoch}_valid_loss={round(best_loss, 4)}")
-                   
-            
-            
-
-        
-
-
-
-
-
-
-
-
+            if epoch % args.validate_every == 0 or epoch == EPOCHS:
+                valid_loss = validation(eval_dataloader, model, VALID_BATCH_SIZE, optimizer, scheduler, epoch=epoch, report_dir=f"{args.ckpt_dir}/validation")
+                list_loss_valid.append(valid_loss)
+                best_loss = min(best_loss, valid_loss)
+                checkpoints.save_best(model, optimizer, scheduler, epoch, num_batches, valid_loss, best_loss=best_loss, global_step=global_step)
+            checkpoints.save_last(model, optimizer, scheduler, epoch, num_batches, best_loss=best_loss, global_step=global_step)
+
+            if world_size > 1:
+                dist.barrier()
+
+        if checkpoints is not None:
+            checkpoints.close()
+        if args.distributed:
+            dist.destroy_process_group()
@@ -1,18 +1,31 @@
 import torch
 from torch.utils.data import Dataset, DataLoader
 import json  
-from transformers import BartTokenizer, BartForConditionalGeneration,AutoModelForSeq2SeqLM, AutoTokenizer, T5Tokenizer, T5ForConditionalGeneration
+import hashlib
+import os
+import re
+import random
+from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import Sampler
+from torch.utils.data.distributed import DistributedSampler
 class CustomDataset(Dataset):
-    def __init__(self, data, tokenizer,max_length=1024):
+    def __init__(self, data, tokenizer,max_length=1024, cache_dir=None, data_file=None, pad_to_max_length=True):
         
         self.data = data
         self.tokenizer = tokenizer
         self.max_length = max_length
+        # With pad_to_max_length=False items are left unpadded and Seq2SeqCollator pads each batch to its longest item.
+        self.pad_to_max_length = pad_to_max_length
+        self.padding = "max_length" if pad_to_max_length else False
+        # Opt-in: tokenize the whole file once and reuse the cache across epochs and runs.
+        self.cache_dir = cache_dir
+        self.data_file = data_file
+        self.encoded = self.pretokenize() if cache_dir is not None else None
       
     def __len__(self):
         return len(self.data)
 
-    def __getitem__(self, idx):
+    def build_example(self, idx):
         answers = self.data[idx]['answers']
         target_text = self.data[idx]['Summary']
         defn = ""
@@ -69,28 +82,175 @@ class CustomDataset(Dataset):
         non_empty_sentences = ' '.join([sentence.replace('\n', '') for sentence in answers])
        
         task_prefix = "Adhering to the condition of 'begin summary with' and 'tone of summary' and summarize according to "+self.data[idx]['Perspective'].strip()+ "and start the summary with '"+ start_with.strip()+ "'. Maintain summary tone as " + tone_attribute.strip()+ ". Definition of perspective: "+ defn.strip().lower() + " Content to summarize: "+ non_empty_sentences +" Question: "+ self.data[idx]['question'].strip()+"."
-        
-        inputs = self.tokenizer(task_prefix, padding="max_length", max_length=self.max_length, truncation=True, return_tensors="pt")
-        labels = self.tokenizer(target_text, truncation=True, padding="max_length", max_length=self.max_length, return_tensors="pt")
+        return task_prefix, target_text
+
+    def cache_path(self):
+        # Cache key: tokenizer name, max_length and a hash of the data file contents.
+        digest = hashlib.sha256()
+        store_meta = os.path.join(self.data_file, "meta.json") if self.data_file is not None else None
+        if store_meta is not None and os.path.isfile(store_meta):
+            # A corpus store (corpus_store.py) records the hash of the JSON file it was built from,
+            # so it shares the cache with that file.
+            with open(store_meta, 'r', encoding='utf-8') as f:
+                content_hash = json.load(f)['source_sha256']
+        elif self.data_file is not None:
+            with open(self.data_file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            content_hash = digest.hexdigest()
+        else:
+            digest.update(json.dumps(self.data, sort_keys=True).encode('utf-8'))
+            content_hash = digest.hexdigest()
+        tokenizer_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', getattr(self.tokenizer, 'name_or_path', '') or type(self.tokenizer).__name__)
+        padding = "pad" if self.pad_to_max_length else "dyn"
+        return os.path.join(self.cache_dir, f"{tokenizer_name}_len{self.max_length}_{padding}_{content_hash[:16]}.pt")
+
+    def pretokenize(self, batch_size=256):
+        path = self.cache_path()
+        if os.path.exists(path):
+            print(f"Loading pre-tokenized dataset from {path}")
+            return torch.load(path)
+
+        print(f"Pre-tokenizing {len(self.data)} examples into {path}")
+        input_ids, attention_mask, labels = [], [], []
+        for start in range(0, len(self.data), batch_size):
+            prefixes, targets = zip(*[self.build_example(idx) for idx in range(start, min(start + batch_size, len(self.data)))])
+            inputs = self.tokenizer(list(prefixes), padding=self.padding, max_length=self.max_length, truncation=True)
+            target_ids = self.tokenizer(list(targets), truncation=True, padding=self.padding, max_length=self.max_length)
+            input_ids.extend(torch.tensor(ids) for ids in inputs["input_ids"])
+            attention_mask.extend(torch.tensor(mask) for mask in inputs["attention_mask"])
+            labels.extend(torch.tensor(ids) for ids in target_ids["input_ids"])
+        encoded = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "labels": labels,
+        }
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a truncated cache behind.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(encoded, tmp_path)
+        os.replace(tmp_path, path)
+        return encoded
+
+    def __getitem__(self, idx):
+        if self.encoded is not None:
+            input_ids = self.encoded["input_ids"][idx]
+            attention_mask = self.encoded["attention_mask"][idx]
+            labels = self.encoded["labels"][idx]
+        else:
+            task_prefix, target_text = self.build_example(idx)
+            inputs = self.tokenizer(task_prefix, padding=self.padding, max_length=self.max_length, truncation=True, return_tensors="pt")
+            target_ids = self.tokenizer(target_text, truncation=True, padding=self.padding, max_length=self.max_length, return_tensors="pt")
+            input_ids = inputs["input_ids"].squeeze(0)
+            attention_mask = inputs["attention_mask"].squeeze(0)
+            labels = target_ids["input_ids"].squeeze(0)
             
         return {
-            "input_ids": inputs["input_ids"].squeeze(),
-            "attention_mask": inputs["attention_mask"].squeeze(),
-            "labels": labels["input_ids"].squeeze(),
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "labels": labels,
             "perspective": self.data[idx]['Perspective'],
-            "Summary": self.data[idx]['Summary']
+            "Summary": self.data[idx]['Summary'],
+            "index": idx
            
         }
-def create_dataloader(train_dataset,valid_dataset, TRAIN_BATCH_SIZE, VALID_BATCH_SIZE ):
+
+    def lengths(self):
+        # Input lengths used for length-grouped batching; whitespace tokens approximate them when nothing is cached.
+        if self.encoded is not None:
+            return [len(ids) for ids in self.encoded["input_ids"]]
+        return [min(len(self.build_example(idx)[0].split()), self.max_length) for idx in range(len(self.data))]
+
+
+class Seq2SeqCollator:
+    """Pads a batch of unpadded CustomDataset items to the longest item in the batch."""
+
+    def __init__(self, pad_token_id, label_pad_token_id=None):
+        self.pad_token_id = pad_token_id
+        # Labels are padded with the pad token by default, matching the fixed max_length padding.
+        self.label_pad_token_id = pad_token_id if label_pad_token_id is None else label_pad_token_id
+
+    def __call__(self, items):
+        return {
+            "input_ids": pad_sequence([item["input_ids"] for item in items], batch_first=True, padding_value=self.pad_token_id),
+            "attention_mask": pad_sequence([item["attention_mask"] for item in items], batch_first=True, padding_value=0),
+            "labels": pad_sequence([item["labels"] for item in items], batch_first=True, padding_value=self.label_pad_token_id),
+            "perspective": [item["perspective"] for item in items],
+            "Summary": [item["Summary"] for item in items],
+            "index": torch.tensor([item["index"] for item in items]),
+        }
+
+
+class LengthGroupedBatchSampler(Sampler):
+    """Yields batches of indices whose examples have similar lengths.
+
+    Indices are shuffled, cut into pools of ``batch_size * pool_factor``, sorted by length inside
+    each pool and split into batches; the order of the batches is shuffled again when ``shuffle``.
+    With ``num_replicas > 1`` every rank takes every ``num_replicas``-th batch, repeating batches
+    at the end so that all ranks run the same number of steps.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, pool_factor=50, seed=0, num_replicas=1, rank=0):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_size = batch_size * pool_factor
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        num_batches = (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        return (num_batches + self.num_replicas - 1) // self.num_replicas
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        indices = list(range(len(self.lengths)))
+        pool_size = self.pool_size
+        if self.shuffle:
+            rng.shuffle(indices)
+            self.epoch += 1
+        else:
+            # Without shuffling the whole dataset is one pool, so batches come out longest first.
+            pool_size = max(len(indices), 1)
+        batches = []
+        for start in range(0, len(indices), pool_size):
+            pool = sorted(indices[start:start + pool_size], key=lambda idx: self.lengths[idx], reverse=True)
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        if self.shuffle:
+            rng.shuffle(batches)
+        if self.num_replicas > 1:
+            padding = len(self) * self.num_replicas - len(batches)
+            batches = (batches + batches[:padding])[self.rank::self.num_replicas]
+        return iter(batches)
+
+
+def _make_dataloader(dataset, batch_size, shuffle, group_by_length, num_replicas=1, rank=0):
+    collate_fn = None if dataset.pad_to_max_length else Seq2SeqCollator(dataset.tokenizer.pad_token_id)
+    if group_by_length:
+        batch_sampler = LengthGroupedBatchSampler(dataset.lengths(), batch_size, shuffle=shuffle, num_replicas=num_replicas, rank=rank)
+        return DataLoader(dataset = dataset, batch_sampler = batch_sampler, collate_fn = collate_fn)
+    if num_replicas > 1:
+        sampler = DistributedSampler(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle)
+        return DataLoader(dataset = dataset, batch_size = batch_size, sampler = sampler, collate_fn = collate_fn)
+    return DataLoader(dataset = dataset, batch_size = batch_size, shuffle = shuffle, collate_fn = collate_fn)
+
+def create_dataloader(train_dataset,valid_dataset, TRAIN_BATCH_SIZE, VALID_BATCH_SIZE, group_by_length=False, num_replicas=1, rank=0 ):
     
-    train_dataloader= DataLoader(dataset = train_dataset, batch_size = TRAIN_BATCH_SIZE, shuffle= True)
-    valid_dataloader = DataLoader(dataset = valid_dataset, batch_size = VALID_BATCH_SIZE, shuffle=True)
+    # Only the training set is sharded across ranks; validation runs on rank 0 over the whole set.
+    train_dataloader= _make_dataloader(train_dataset, TRAIN_BATCH_SIZE, True, group_by_length, num_replicas, rank)
+    valid_dataloader = _make_dataloader(valid_dataset, VALID_BATCH_SIZE, True, group_by_length)
     
     return train_dataloader , valid_dataloader
 
-def test_create_dataloader(test_dataset, TEST_BATCH_SIZE ):
+def test_create_dataloader(test_dataset, TEST_BATCH_SIZE, group_by_length=False ):
     
-    test_dataloader= DataLoader(dataset = test_dataset, batch_size = TEST_BATCH_SIZE, shuffle= False)
+    test_dataloader= _make_dataloader(test_dataset, TEST_BATCH_SIZE, False, group_by_length)
      
     return test_dataloader
 
@@ -0,0 +1,193 @@
+import json
+import re
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from evaluate_spans import CATEGORIES, document_text, load_records
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word and punctuation tokens, so whitespace and case differences do not matter."""
+    return [token.lower() for token in TOKEN.findall(text)]
+
+class AnswerIndex:
+    """
+    Token n-gram index over the text of one record, used to map span text to character offsets.
+
+    A span is aligned by exact substring search first. Otherwise each of its n-grams votes
+    for the document position it would start at (document position minus span position),
+    and the best-supported position gives the candidate window. The window is scored by
+    token overlap with the span, so paraphrased or lightly edited spans still get offsets,
+    while spans whose best window scores below ``min_score`` are reported as hallucinated.
+    """
+
+    def __init__(self, text: str, n: int = 3):
+        self.text = text
+        self.n = n
+        matches = list(TOKEN.finditer(text))
+        self.token_starts = np.array([m.start() for m in matches], dtype=np.int64)
+        self.token_ends = np.array([m.end() for m in matches], dtype=np.int64)
+        self.tokens = [m.group().lower() for m in matches]
+        self.vocab = {}
+        self.ids = np.array([self.vocab.setdefault(token, len(self.vocab)) for token in self.tokens], dtype=np.int64)
+        self.unigrams = self._build(1)
+        self.ngrams = self._build(n)
+
+    def _build(self, n: int) -> Dict[Tuple[int, ...], np.ndarray]:
+        index = {}
+        ids = self.ids.tolist()
+        for i in range(len(ids) - n + 1):
+            index.setdefault(tuple(ids[i:i + n]), []).append(i)
+        return {key: np.array(positions, dtype=np.int64) for key, positions in index.items()}
+
+    def align(self, span: str, min_score: float = 0.5, taken: Optional[Set[Tuple[int, int]]] = None) -> Dict:
+        """
+        Maps one span to character offsets in the indexed text.
+
+        Args:
+            span (str): Predicted span text
+            min_score (float): Minimum token-overlap F1 for a fuzzy match
+            taken (Set[Tuple[int, int]]): Intervals already used in this category; a repeated
+                span is moved to its next exact occurrence when there is one
+
+        Returns:
+            Dict: 'label_spans' [start, end] (or None), 'match' (exact, normalized, fuzzy
+            or hallucinated) and 'score'
+        """
+        taken = taken or set()
+        stripped = span.strip()
+        if stripped:
+            start = self.text.find(stripped)
+            first = None
+            while start >= 0:
+                interval = (start, start + len(stripped))
+                first = first or interval
+                if interval not in taken:
+                    break
+                start = self.text.find(stripped, start + 1)
+            interval = interval if start >= 0 else first
+            if interval is not None:
+                return {"label_spans": list(interval), "match": "exact", "score": 1.0}
+
+        span_tokens = tokenize(span)
+        m = len(span_tokens)
+        if m == 0 or len(self.tokens) == 0:
+            return {"label_spans": None, "match": "hallucinated", "score": 0.0}
+        span_ids = [self.vocab.get(token, -1) for token in span_tokens]
+
+        n, index = (self.n, self.ngrams) if m >= self.n else (1, self.unigrams)
+        positions, offsets = [], []
+        for j in range(m - n + 1):
+            hits = index.get(tuple(span_ids[j:j + n]))
+            if hits is not None:
+                positions.append(hits)
+                offsets.append(np.full(len(hits), j, dtype=np.int64))
+        if not positions:
+            return {"label_spans": None, "match": "hallucinated", "score": 0.0}
+        positions = np.concatenate(positions)
+        diagonals = positions - np.concatenate(offsets)
+
+        # Best-supported start position; nearby diagonals absorb small insertions and deletions.
+        values, counts = np.unique(diagonals, return_counts=True)
+        best = values[np.argmax(counts)]
+        slack = max(2, m // 5)
+        near = np.abs(diagonals - best) <= slack
+        first_token = int(positions[near].min())
+        last_token = int(positions[near].max()) + n - 1
+
+        window = self.tokens[first_token:last_token + 1]
+        common = sum((Counter(window) & Counter(span_tokens)).values())
+        score = 2 * common / (len(window) + m)
+        if score < min_score:
+            return {"label_spans": None, "match": "hallucinated", "score": score}
+        interval = [int(self.token_starts[first_token]), int(self.token_ends[last_token])]
+        match = "normalized" if window == span_tokens else "fuzzy"
+        return {"label_spans": interval, "match": match, "score": score}
+
+def align_entry(entry: Dict, text: str, min_score: float = 0.5, index: Optional[AnswerIndex] = None) -> Dict:
+    """
+    Aligns the spans of one prediction entry to its source text.
+
+    Args:
+        entry (Dict): Entry with 'uri' and 'spans'
+        text (str): Source text of the record (see document_text)
+        min_score (float): Minimum token-overlap F1 for a fuzzy match
+        index (AnswerIndex): Prebuilt index over text, built when None
+
+    Returns:
+        Dict: The entry with 'labelled_answer_spans' in the gold shape ('txt' is the source
+        text at 'label_spans', 'predicted' the original span) and 'hallucinated_spans'.
+        Every predicted span is kept, so the evaluator still counts it as a prediction:
+        hallucinated spans get label_spans [-1, -1], and a span aligned to an interval
+        already used in the same category keeps that interval and is marked 'duplicate'.
+        Strict matching counts an exact gold match once, so a duplicate is a false positive
+        there; proportional precision credits its overlap with gold spans again.
+    """
+    index = index or AnswerIndex(text)
+    aligned = dict(entry)
+    aligned['labelled_answer_spans'] = {}
+    aligned['hallucinated_spans'] = {}
+    for category in CATEGORIES:
+        taken = set()
+        labelled, hallucinated = [], []
+        for span in entry.get('spans', {}).get(category, []):
+            result = index.align(span, min_score, taken)
+            if result['label_spans'] is None:
+                hallucinated.append(span)
+                labelled.append({"txt": span, "label_spans": [-1, -1], "match": "hallucinated",
+                                 "score": round(result['score'], 4), "predicted": span})
+                continue
+            start, end = result['label_spans']
+            item = {"txt": text[start:end], "label_spans": [start, end],
+                    "match": result['match'], "score": round(result['score'], 4), "predicted": span}
+            if (start, end) in taken:
+                item["duplicate"] = True
+            taken.add((start, end))
+            labelled.append(item)
+        aligned['labelled_answer_spans'][category] = labelled
+        aligned['hallucinated_spans'][category] = hallucinated
+    return aligned
+
+def align_records(predictions: List[Dict], sources: List[Dict], min_score: float = 0.5) -> List[Dict]:
+    """
+    Aligns every prediction entry to the source record with the same URI.
+
+    Args:
+        predictions (List[Dict]): Entries with 'uri' and 'spans'
+        sources (List[Dict]): Records with 'uri' and 'answers' (or 'raw_text')
+        min_score (float): Minimum token-overlap F1 for a fuzzy match
+
+    Returns:
+        List[Dict]: Aligned entries, in prediction order; entries without a source are skipped
+    """
+    texts = {int(record['uri']): document_text(record) for record in sources}
+    aligned = []
+    for entry in predictions:
+        uri = int(entry['uri'])
+        if uri in texts:
+            aligned.append(align_entry(entry, texts[uri], min_score))
+    return aligned
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map predicted span text to character offsets in the source answers.")
+    parser.add_argument("--pred", default="claude_answers/spans", help="submission-format JSON file, or a directory of output_*.json")
+    parser.add_argument("--source", default="test_no_label.json", help="records with 'uri' and 'answers'")
+    parser.add_argument("--output_file", default="aligned_spans.json")
+    parser.add_argument("--min_score", type=float, default=0.5)
+    args = parser.parse_args()
+
+    aligned = align_records(load_records(args.pred), load_records(args.source), args.min_score)
+    with open(args.output_file, 'w', encoding='utf-8') as f:
+        json.dump(aligned, f, indent=2, ensure_ascii=False)
+
+    print(f"{'category':<12} {'exact':>7} {'normal.':>7} {'fuzzy':>7} {'halluc.':>7} {'dup.':>7}")
+    for category in CATEGORIES:
+        items = [item for entry in aligned for item in entry['labelled_answer_spans'][category]]
+        counts = Counter(item['match'] for item in items)
+        duplicates = sum(1 for item in items if item.get('duplicate'))
+        print(f"{category:<12} {counts['exact']:>7} {counts['normalized']:>7} {counts['fuzzy']:>7} {counts['hallucinated']:>7} {duplicates:>7}")
+    print(f"\nAligned {len(aligned)} entries; output written to {args.output_file}")
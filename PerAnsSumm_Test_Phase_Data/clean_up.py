@@ -1,21 +1,17 @@
 import json
 
+from corpus_store import load_corpus
+
 def clean_json(input_file, output_file):
     """
     Remove 'raw_text' entries from a JSON file containing QA data.
     
     Args:
-        input_file (str): Path to input JSON file
+        input_file (str): Path to input JSON file or corpus store directory
         output_file (str): Path to save cleaned JSON file
     """
-    # Read the JSON file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Remove raw_text from each entry
-    for entry in data:
-        if 'raw_text' in entry:
-            del entry['raw_text']
+    # Read the entries without raw_text; a corpus store never reads that column at all
+    data = list(load_corpus(input_file, exclude=['raw_text']))
     
     # Write the cleaned data
     with open(output_file, 'w', encoding='utf-8') as f:
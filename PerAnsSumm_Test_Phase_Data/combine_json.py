@@ -1,9 +1,13 @@
 import json
 from pathlib import Path
-from typing import Dict, List, Union, Set
+from typing import Callable, Dict, List, Union, Set, Tuple, Iterator
 import sys
-from copy import deepcopy
+import os
 import re
+import hashlib
+import argparse
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
 
 class JSONValidationError(Exception):
     """Custom exception for JSON validation errors."""
@@ -11,16 +15,22 @@ class JSONValidationError(Exception):
 
 def normalize_entry(entry: Dict) -> Dict:
     """Normalizes an entry for comparison by sorting arrays and standardizing format."""
-    entry = deepcopy(entry)
+    normalized = dict(entry)
     # Sort arrays in spans
-    for category in entry['spans']:
-        if isinstance(entry['spans'][category], list):
-            entry['spans'][category] = sorted(entry['spans'][category])
-    return entry
+    normalized['spans'] = {
+        category: sorted(spans) if isinstance(spans, list) else spans
+        for category, spans in entry['spans'].items()
+    }
+    return normalized
+
+def entry_digest(entry: Dict) -> str:
+    """Content hash of an entry that ignores key order and span order."""
+    canonical = json.dumps(normalize_entry(entry), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
 
 def entries_are_equal(entry1: Dict, entry2: Dict) -> bool:
     """Compares two entries after normalization."""
-    return normalize_entry(entry1) == normalize_entry(entry2)
+    return entry_digest(entry1) == entry_digest(entry2)
 
 def validate_and_fix_entry(entry: Dict, file_name: str, entry_index: int) -> Dict:
     """Validates and fixes a single JSON entry."""
@@ -79,10 +89,87 @@ def extract_file_number(filename: str) -> int:
         return int(match.group(1))
     return 0
 
-def merge_json_files(directory_path: str, output_file: str = "merged_output.json") -> None:
+def parse_shard(json_file: Path) -> Tuple[str, List[Tuple[int, str, int, str]], List[str]]:
+    """
+    Parses and validates one shard file.
+    
+    Runs in a worker process, so it returns entries already serialized for the
+    output file rather than as dictionaries.
+    
+    Args:
+        json_file (Path): Path to an output_*.json file
+        
+    Returns:
+        Tuple[str, List[Tuple[int, str, int, str]], List[str]]: File name,
+        (uri, content hash, entry index, serialized entry) per valid entry, and errors
+    """
+    entries = []
+    errors = []
+    with open(json_file, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            return json_file.name, entries, [f"Invalid JSON in file {json_file.name}: {str(e)}"]
+    
+    if not isinstance(data, list):
+        return json_file.name, entries, [f"File {json_file.name} must contain a JSON array"]
+    
+    for i, entry in enumerate(data, 1):
+        try:
+            fixed_entry = validate_and_fix_entry(entry, json_file.name, i)
+        except JSONValidationError as e:
+            errors.append(str(e))
+            continue
+        # Same layout as json.dump(entries, indent=2): each entry indented one level.
+        text = textwrap.indent(json.dumps(fixed_entry, indent=2, ensure_ascii=False), '  ')
+        entries.append((fixed_entry['uri'], entry_digest(fixed_entry), i, text))
+    return json_file.name, entries, errors
+
+def iter_parsed_shards(json_files: List[Path], workers: int) -> Iterator[Tuple[str, List[Tuple[int, str, int, str]], List[str]]]:
+    """
+    Yields parse_shard results in the order of json_files.
+    
+    At most 2 * workers shards are parsed ahead of the one being written, so
+    memory stays bounded however many shard files there are.
+    """
+    if workers <= 1:
+        for json_file in json_files:
+            yield parse_shard(json_file)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = 2 * workers
+        futures = [executor.submit(parse_shard, json_file) for json_file in json_files[:window]]
+        for position in range(len(json_files)):
+            result = futures[position].result()
+            futures[position] = None
+            if position + window < len(json_files):
+                futures.append(executor.submit(parse_shard, json_files[position + window]))
+            yield result
+
+def merge_json_files(directory_path: str, output_file: str = "merged_output.json", workers: int = None,
+                     cache=None, records: List[Dict] = None, cache_key: Callable[[Dict], str] = None) -> None:
     """
     Merges all JSON files from a directory, validates their content, and outputs a single merged file.
-    Processes files sequentially, maintaining order within each file.
+    
+    Files are parsed in parallel but written in file-number order, maintaining order
+    within each file, and the output is streamed rather than built in memory. When a
+    URI appears more than once the first occurrence wins; later ones are reported
+    as exact duplicates or, when their content hash differs, as conflicts.
+    
+    With a response cache (see response_cache.py), each of records whose URI no file
+    provides a valid entry for is looked up under cache_key(record), the key its reply
+    was cached under, and a hit is appended after the file entries. Only these records
+    are filled, so entries cached for other datasets or for an earlier version of an
+    edited record are never picked up.
+    
+    Args:
+        directory_path (str): Directory containing output_*.json files
+        output_file (str): Name of the merged file, written inside directory_path
+        workers (int): Number of parser processes; defaults to the CPU count
+        cache (ResponseCache): Optional response cache to fill missing URIs from
+        records (List[Dict]): The input records of the run, required with cache
+        cache_key (Callable): Cache key of a record, e.g. llm_driver.Driver.cache_key
     """
     directory = Path(directory_path)
     if not directory.exists():
@@ -95,51 +182,63 @@ def merge_json_files(directory_path: str, output_file: str = "merged_output.json
     if not json_files:
         raise FileNotFoundError(f"No JSON files found in {directory_path}")
     
-    # Track all entries and URIs
-    merged_entries = []
-    seen_uris = set()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(json_files)))
+    
+    # Only the URI, hash and origin of each kept entry stay in memory
+    kept = {}
+    written = 0
     errors = []
     
-    # Process each file sequentially
-    for json_file in json_files:
-        print(f"Processing {json_file.name}...")
-        
-        with open(json_file, 'r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                errors.append(f"Invalid JSON in file {json_file.name}: {str(e)}")
-                continue
-            
-            if not isinstance(data, list):
-                errors.append(f"File {json_file.name} must contain a JSON array")
-                continue
-            
-            # Process all entries in this file
-            for i, entry in enumerate(data, 1):
-                try:
-                    fixed_entry = validate_and_fix_entry(entry, json_file.name, i)
-                    uri = fixed_entry['uri']
-                    
-                    # Skip if we've seen this URI before
-                    if uri in seen_uris:
-                        errors.append(f"Skipping duplicate URI {uri} in {json_file.name}, entry {i}")
-                        continue
-                    
-                    seen_uris.add(uri)
-                    merged_entries.append(fixed_entry)
-                    
-                except JSONValidationError as e:
-                    errors.append(str(e))
-    
-    # Write the merged and fixed output
     output_path = directory / output_file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(merged_entries, f, indent=2, ensure_ascii=False)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write("[")
+        for file_name, entries, file_errors in iter_parsed_shards(json_files, workers):
+            print(f"Processing {file_name}...")
+            errors.extend(file_errors)
+            for uri, digest, i, text in entries:
+                if uri in kept:
+                    kept_digest, kept_file, kept_index = kept[uri]
+                    if digest == kept_digest:
+                        errors.append(f"Skipping duplicate URI {uri} in {file_name}, entry {i}")
+                    else:
+                        errors.append(
+                            f"Conflicting entry for URI {uri} in {file_name}, entry {i}; "
+                            f"keeping {kept_file}, entry {kept_index}"
+                        )
+                    continue
+                kept[uri] = (digest, file_name, i)
+                out.write(("," if written else "") + "\n" + text)
+                written += 1
+        if cache is not None:
+            filled = 0
+            for record in records:
+                uri = int(record['uri'])
+                if uri in kept:
+                    continue
+                value = cache.get(cache_key(record))
+                if value is None:
+                    continue
+                try:
+                    fixed_entry = validate_and_fix_entry(json.loads(value), "response cache", uri)
+                except (JSONValidationError, ValueError, TypeError):
+                    continue
+                if fixed_entry['uri'] != uri:
+                    continue
+                kept[uri] = (entry_digest(fixed_entry), "response cache", uri)
+                text = textwrap.indent(json.dumps(fixed_entry, indent=2, ensure_ascii=False), '  ')
+                out.write(("," if written else "") + "\n" + text)
+                written += 1
+                filled += 1
+            print(f"Filled {filled} entries from the response cache")
+        out.write("\n]" if written else "]")
+    os.replace(tmp_path, output_path)
     
     # Report results
     print("\nProcessing complete!")
-    print(f"Total unique entries processed: {len(merged_entries)}")
+    print(f"Total unique entries processed: {written}")
     print(f"Output written to: {output_path}")
     
     if errors:
@@ -148,15 +247,38 @@ def merge_json_files(directory_path: str, output_file: str = "merged_output.json
             print(f"- {error}")
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <directory_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Merge and validate output_*.json files into one submission file.")
+    parser.add_argument("directory", nargs="?", default="claude_answers/spans")
+    parser.add_argument("--output_file", default="merged_output.json")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache_dir", default=None, help="fill missing URIs from this llm_driver.py response cache")
+    parser.add_argument("--shard_dir", default=None,
+                        help="input shards of the run; required with --cache_dir, only their records are filled")
+    # The cache key of a record depends on the request options, so they must match the llm_driver.py run.
+    from llm_driver import add_request_args, driver_from_args, find_shards
+    add_request_args(parser)
+    args = parser.parse_args()
+    if args.cache_dir is not None and args.shard_dir is None:
+        parser.error("--cache_dir requires --shard_dir")
     
+    cache = None
     try:
-        merge_json_files(sys.argv[1])
+        records, cache_key = None, None
+        if args.cache_dir is not None:
+            from response_cache import ResponseCache
+            cache = ResponseCache(args.cache_dir)
+            records = []
+            for shard in find_shards(args.shard_dir):
+                with open(shard, 'r', encoding='utf-8') as f:
+                    records.extend(json.load(f))
+            cache_key = driver_from_args(args, args.directory, cache).cache_key
+        merge_json_files(args.directory, args.output_file, args.workers, cache, records, cache_key)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if cache is not None:
+            cache.close()
 
 if __name__ == "__main__":
-    merge_json_files("claude_answers/spans")
\ No newline at end of file
+    main()
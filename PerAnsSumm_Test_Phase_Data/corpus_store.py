@@ -0,0 +1,261 @@
+import json
+import hashlib
+import argparse
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from json_split import iter_json_array
+
+META_FILE = "meta.json"
+
+def infer_kind(values: Iterable[Any]) -> str:
+    """
+    Storage kind of a column from its present values.
+
+    'int' and 'float' become NumPy arrays, 'str' a UTF-8 blob with an offset table,
+    'str_list' (e.g. answers) a blob with string offsets plus row pointers, and anything
+    else 'json': each value serialized into a string column.
+    """
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            kinds.add('json')
+        elif isinstance(value, int):
+            kinds.add('int')
+        elif isinstance(value, float):
+            kinds.add('float')
+        elif isinstance(value, str):
+            kinds.add('str')
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            kinds.add('str_list')
+        else:
+            kinds.add('json')
+        if len(kinds) > 1:
+            return 'json'
+    return kinds.pop() if kinds else 'json'
+
+def convert(input_file: str, store_dir: str) -> Dict:
+    """
+    Converts a JSON array of records into a columnar store.
+
+    The input is streamed twice, once to infer each column's kind and count the rows and
+    once to write the columns, so the whole file is never held in memory.
+
+    Args:
+        input_file (str): JSON file such as train.json, valid.json or test_no_label.json
+        store_dir (str): Output directory
+
+    Returns:
+        Dict: The store metadata
+    """
+    input_path = Path(input_file)
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    columns, kinds, num_rows = [], {}, 0
+    for record in iter_json_array(input_path):
+        previous = None
+        for name, value in record.items():
+            kind = infer_kind([value])
+            if name not in kinds:
+                # Place a column first seen late (e.g. context missing from the first record)
+                # after its predecessor, so rows come back with the key order of the JSON.
+                columns.insert(columns.index(previous) + 1 if previous is not None else 0, name)
+                kinds[name] = kind
+            elif kinds[name] != kind:
+                kinds[name] = 'json'
+            previous = name
+        num_rows += 1
+
+    present = {name: np.zeros(num_rows, dtype=bool) for name in columns}
+    numbers = {name: np.zeros(num_rows, dtype=np.int64 if kinds[name] == 'int' else np.float64)
+               for name in columns if kinds[name] in ('int', 'float')}
+    offsets = {name: [0] for name in columns if kinds[name] in ('str', 'json', 'str_list')}
+    row_ptr = {name: np.zeros(num_rows + 1, dtype=np.int64) for name in columns if kinds[name] == 'str_list'}
+    blobs = {name: open(store_dir / f"{name}.bin", 'wb') for name in offsets}
+
+    def write_string(name, text):
+        data = text.encode('utf-8')
+        blobs[name].write(data)
+        offsets[name].append(offsets[name][-1] + len(data))
+
+    source_digest = hashlib.sha256()
+    with open(input_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            source_digest.update(block)
+
+    try:
+        for row, record in enumerate(iter_json_array(input_path)):
+            for name in columns:
+                kind = kinds[name]
+                if name in record:
+                    present[name][row] = True
+                    value = record[name]
+                else:
+                    value = None
+                if kind in ('int', 'float'):
+                    numbers[name][row] = value if value is not None else 0
+                elif kind == 'str':
+                    write_string(name, value if value is not None else "")
+                elif kind == 'json':
+                    write_string(name, json.dumps(value, ensure_ascii=False) if name in record else "")
+                else:
+                    for item in value or []:
+                        write_string(name, item)
+                    row_ptr[name][row + 1] = len(offsets[name]) - 1
+    finally:
+        for blob in blobs.values():
+            blob.close()
+
+    for name in columns:
+        if name in numbers:
+            np.save(store_dir / f"{name}.npy", numbers[name])
+        if name in offsets:
+            np.save(store_dir / f"{name}.offsets.npy", np.array(offsets[name], dtype=np.int64))
+        if name in row_ptr:
+            np.save(store_dir / f"{name}.rows.npy", row_ptr[name])
+        if not present[name].all():
+            np.save(store_dir / f"{name}.present.npy", present[name])
+
+    meta = {
+        "num_rows": num_rows,
+        "columns": [{"name": name, "kind": kinds[name], "nullable": not bool(present[name].all())} for name in columns],
+        "source": input_path.name,
+        "source_sha256": source_digest.hexdigest(),
+    }
+    with open(store_dir / META_FILE, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+class CorpusStore(Sequence):
+    """
+    Read-only, memory-mapped view of a store written by ``convert``.
+
+    Only the projected columns are opened (``columns`` keeps, ``exclude`` drops), so an
+    unused column such as raw_text is never read. Rows are returned as dicts with the
+    same keys and values as the original JSON records, and random access only touches
+    the bytes of that row. Whole numeric columns are available zero-copy through
+    ``column``. Being a Sequence, a store can stand in for the list from ``json.load``,
+    e.g. as the data of CustomDataset or in random.sample.
+    """
+
+    def __init__(self, store_dir: str, columns: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        available = [column['name'] for column in self.meta['columns']]
+        unknown = set(columns or []) - set(available)
+        if unknown:
+            raise KeyError(f"Unknown columns {sorted(unknown)}; the store has {available}")
+        self.columns = [name for name in available
+                        if (columns is None or name in columns) and name not in (exclude or [])]
+        self.kinds = {column['name']: column['kind'] for column in self.meta['columns']}
+        self.arrays = {}
+        for name in self.columns:
+            column = {}
+            kind = self.kinds[name]
+            if kind in ('int', 'float'):
+                column['values'] = np.load(self.store_dir / f"{name}.npy", mmap_mode='r')
+            else:
+                column['offsets'] = np.load(self.store_dir / f"{name}.offsets.npy", mmap_mode='r')
+                blob_path = self.store_dir / f"{name}.bin"
+                # np.memmap cannot map an empty file.
+                column['blob'] = (np.memmap(blob_path, dtype=np.uint8, mode='r')
+                                  if blob_path.stat().st_size else np.zeros(0, dtype=np.uint8))
+                if kind == 'str_list':
+                    column['rows'] = np.load(self.store_dir / f"{name}.rows.npy", mmap_mode='r')
+            present_path = self.store_dir / f"{name}.present.npy"
+            if present_path.exists():
+                column['present'] = np.load(present_path, mmap_mode='r')
+            self.arrays[name] = column
+        self._last = (None, None)
+
+    def __len__(self) -> int:
+        return self.meta['num_rows']
+
+    def _string(self, column: Dict, i: int) -> str:
+        start, end = int(column['offsets'][i]), int(column['offsets'][i + 1])
+        return column['blob'][start:end].tobytes().decode('utf-8')
+
+    def value(self, name: str, row: int) -> Any:
+        column, kind = self.arrays[name], self.kinds[name]
+        if kind in ('int', 'float'):
+            return column['values'][row].item()
+        if kind == 'str':
+            return self._string(column, row)
+        if kind == 'json':
+            return json.loads(self._string(column, row))
+        start, end = int(column['rows'][row]), int(column['rows'][row + 1])
+        return [self._string(column, i) for i in range(start, end)]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Row {index} out of range for {len(self)} rows")
+        # CustomDataset reads several fields of the same row in a row; keep the last one decoded.
+        if self._last[0] != index:
+            row = {name: self.value(name, index) for name in self.columns
+                   if 'present' not in self.arrays[name] or self.arrays[name]['present'][index]}
+            self._last = (index, row)
+        return dict(self._last[1])
+
+    def column(self, name: str) -> Union[np.ndarray, List]:
+        """A whole column: a memory-mapped array for numeric kinds, else a list of values."""
+        if self.kinds[name] in ('int', 'float'):
+            return self.arrays[name]['values']
+        return [self.value(name, row) for row in range(len(self))]
+
+    def to_records(self) -> List[Dict]:
+        return [self[i] for i in range(len(self))]
+
+def is_store(path: Union[str, Path]) -> bool:
+    return (Path(path) / META_FILE).is_file()
+
+def load_corpus(path: str, columns: Optional[List[str]] = None, exclude: Optional[List[str]] = None) -> Sequence:
+    """
+    Loads records from a corpus store directory or, for compatibility, a JSON file.
+
+    Args:
+        path (str): Store directory written by corpus_store.py, or a JSON file
+        columns (List[str]): Columns to keep; all when None
+        exclude (List[str]): Columns to drop
+
+    Returns:
+        Sequence: A CorpusStore for a store, or the list of records for a JSON file
+    """
+    if is_store(path):
+        return CorpusStore(path, columns, exclude)
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    if not isinstance(records, list):
+        records = [records]
+    if columns is not None or exclude:
+        records = [{name: value for name, value in record.items()
+                    if (columns is None or name in columns) and name not in (exclude or [])} for record in records]
+    return records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON corpora into memory-mapped columnar stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert")
+    convert_parser.add_argument("files", nargs="+", help="e.g. train.json valid.json test_no_label.json")
+    convert_parser.add_argument("--out_dir", default="corpus", help="each file becomes <out_dir>/<file stem>")
+    info_parser = subparsers.add_parser("info")
+    info_parser.add_argument("store_dir")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for input_file in args.files:
+            store_dir = Path(args.out_dir) / Path(input_file).stem
+            meta = convert(input_file, store_dir)
+            kinds = ", ".join(f"{column['name']}:{column['kind']}" for column in meta['columns'])
+            print(f"{input_file} -> {store_dir}: {meta['num_rows']} rows ({kinds})")
+    else:
+        store = CorpusStore(args.store_dir)
+        print(json.dumps(store.meta, indent=2))
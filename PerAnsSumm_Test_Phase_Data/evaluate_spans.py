@@ -0,0 +1,255 @@
+import json
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from combine_json import extract_file_number
+from corpus_store import CorpusStore, is_store
+
+CATEGORIES = ['EXPERIENCE', 'INFORMATION', 'CAUSE', 'SUGGESTION', 'QUESTION']
+
+def document_text(record: Dict) -> str:
+    """Returns the text that span offsets refer to: raw_text when present, else the joined answers."""
+    return record.get('raw_text') or " ".join(record['answers'])
+
+def locate(text: str, span: str, hint: int = -1) -> Tuple[int, int]:
+    """
+    Finds a span in its document.
+
+    Args:
+        text (str): Document text
+        span (str): Span text
+        hint (int): Start offset from the data, trusted when text matches there
+
+    Returns:
+        Tuple[int, int]: Half-open character interval, or (-1, -1) when the span is not in the text
+    """
+    span = span.strip()
+    if not span:
+        return -1, -1
+    if hint >= 0 and text[hint:hint + len(span)] == span:
+        return hint, hint + len(span)
+    start = text.find(span)
+    if start < 0:
+        return -1, -1
+    return start, start + len(span)
+
+def load_records(path: str) -> List[Dict]:
+    """Loads a JSON array file, a corpus store, or every output_*.json in a directory in file-number order."""
+    path = Path(path)
+    if is_store(path):
+        return CorpusStore(path).to_records()
+    if path.is_dir():
+        files = sorted(path.glob("output_*.json"), key=lambda x: extract_file_number(x.name))
+    else:
+        files = [path]
+    records = []
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        records.extend(data if isinstance(data, list) else [data])
+    return records
+
+class IntervalSet:
+    """
+    Character intervals for one category across a whole corpus.
+
+    Each document is placed at its own offset on a single global axis (with a one-character
+    gap between documents), so overlaps for the full corpus are computed with array
+    operations instead of per-document loops. Spans that could not be located are
+    counted but have an empty interval.
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray):
+        self.starts = starts
+        self.ends = ends
+        located = starts >= 0
+        self.located_starts = starts[located]
+        self.located_ends = ends[located]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.where(self.starts >= 0, self.ends - self.starts, 0)
+
+    def union(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Merges the located intervals into sorted, disjoint intervals."""
+        if len(self.located_starts) == 0:
+            return self.located_starts, self.located_ends
+        order = np.argsort(self.located_starts, kind='stable')
+        starts = self.located_starts[order]
+        ends = np.maximum.accumulate(self.located_ends[order])
+        new_group = np.empty(len(starts), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = starts[1:] > ends[:-1]
+        group_starts = np.flatnonzero(new_group)
+        group_ends = np.append(group_starts[1:], len(starts)) - 1
+        return starts[group_starts], ends[group_ends]
+
+    def keys(self) -> np.ndarray:
+        """One int64 per located interval, equal exactly when both endpoints are equal."""
+        return self.located_starts.astype(np.int64) << 32 | self.located_ends.astype(np.int64)
+
+def coverage(union_starts: np.ndarray, union_ends: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Length of each [start, end) interval covered by a disjoint, sorted union of intervals.
+
+    Uses C(x), the covered length before x, evaluated with searchsorted over the
+    cumulative union lengths, so the cost is O((n + m) log m).
+    """
+    if len(union_starts) == 0 or len(starts) == 0:
+        return np.zeros(len(starts), dtype=np.int64)
+    cumulative = np.concatenate(([0], np.cumsum(union_ends - union_starts)))
+
+    def covered_before(x):
+        k = np.searchsorted(union_starts, x, side='right') - 1
+        safe_k = np.maximum(k, 0)
+        partial = np.clip(x - union_starts[safe_k], 0, union_ends[safe_k] - union_starts[safe_k])
+        return np.where(k >= 0, cumulative[safe_k] + partial, 0)
+
+    located = starts >= 0
+    return np.where(located, covered_before(ends) - covered_before(starts), 0)
+
+def strict_matches(pred: IntervalSet, gold: IntervalSet) -> int:
+    """Number of predicted intervals that exactly match a gold interval, counting multiplicity once."""
+    pred_keys, pred_counts = np.unique(pred.keys(), return_counts=True)
+    gold_keys, gold_counts = np.unique(gold.keys(), return_counts=True)
+    _, pred_idx, gold_idx = np.intersect1d(pred_keys, gold_keys, assume_unique=True, return_indices=True)
+    return int(np.minimum(pred_counts[pred_idx], gold_counts[gold_idx]).sum())
+
+def prf(precision: float, recall: float) -> Dict[str, float]:
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+def build_intervals(records: Dict[int, Dict], texts: Dict[int, str], offsets: Dict[int, int], gold: bool) -> Dict[str, IntervalSet]:
+    """
+    Locates every span of every record on the global axis.
+
+    Args:
+        records (Dict[int, Dict]): Records by URI, in prediction or gold format
+        texts (Dict[int, str]): Document text by URI
+        offsets (Dict[int, int]): Start of each document on the global axis
+        gold (bool): Read labelled_answer_spans instead of spans; predictions
+            that already have labelled_answer_spans are read the same way
+
+    Returns:
+        Dict[str, IntervalSet]: Intervals per category
+    """
+    intervals = {}
+    for category in CATEGORIES:
+        starts, ends = [], []
+        for uri, record in records.items():
+            if uri not in texts:
+                continue
+            text, base = texts[uri], offsets[uri]
+            # Aligned predictions (see align_spans.py) carry offsets in the gold shape.
+            if gold or 'labelled_answer_spans' in record:
+                spans = [(item['txt'], (item.get('label_spans') or [-1])[0], item.get('match') == 'hallucinated')
+                         for item in record.get('labelled_answer_spans', {}).get(category, [])]
+            else:
+                spans = [(span, -1, False) for span in record.get('spans', {}).get(category, [])]
+            for span, hint, hallucinated in spans:
+                # Hallucinated spans stay in the prediction count but are never located.
+                start, end = locate(text, span, hint) if not hallucinated else (-1, -1)
+                starts.append(start + base if start >= 0 else -1)
+                ends.append(end + base if start >= 0 else -1)
+        intervals[category] = IntervalSet(np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64))
+    return intervals
+
+def evaluate_spans(predictions: List[Dict], gold: List[Dict]) -> Dict[str, Dict]:
+    """
+    Scores Task A span predictions against gold spans.
+
+    Strict matching counts a predicted span as correct only when its character interval
+    equals a gold interval of the same category. Proportional matching credits each
+    predicted span with the fraction of its characters inside gold spans (precision) and
+    each gold span with the fraction covered by predictions (recall). Only URIs present
+    in the gold file are scored; a gold URI with no prediction counts as predicting nothing.
+
+    Args:
+        predictions (List[Dict]): Entries with 'uri' and 'spans', as in submission.json
+        gold (List[Dict]): Records with 'uri', 'answers' and 'labelled_answer_spans'
+
+    Returns:
+        Dict[str, Dict]: Strict and proportional scores per category and their macro average
+    """
+    gold_by_uri = {int(record['uri']): record for record in gold}
+    for uri, record in gold_by_uri.items():
+        if 'raw_text' not in record and 'answers' not in record:
+            raise ValueError(f"Gold record {uri} has neither 'raw_text' nor 'answers' to locate spans in")
+    pred_by_uri = {int(entry['uri']): entry for entry in predictions}
+    texts = {uri: document_text(record) for uri, record in gold_by_uri.items()}
+    offsets, position = {}, 0
+    for uri, text in texts.items():
+        offsets[uri] = position
+        position += len(text) + 1
+
+    pred_intervals = build_intervals(pred_by_uri, texts, offsets, gold=False)
+    gold_intervals = build_intervals(gold_by_uri, texts, offsets, gold=True)
+
+    results = {}
+    for category in CATEGORIES:
+        pred, gold_set = pred_intervals[category], gold_intervals[category]
+        matched = strict_matches(pred, gold_set)
+        strict = prf(matched / len(pred) if len(pred) else 0.0,
+                     matched / len(gold_set) if len(gold_set) else 0.0)
+
+        pred_lengths, gold_lengths = pred.lengths, gold_set.lengths
+        pred_overlap = coverage(*gold_set.union(), pred.starts, pred.ends)
+        gold_overlap = coverage(*pred.union(), gold_set.starts, gold_set.ends)
+        precision = float(np.sum(pred_overlap / np.maximum(pred_lengths, 1))) / len(pred) if len(pred) else 0.0
+        recall = float(np.sum(gold_overlap / np.maximum(gold_lengths, 1))) / len(gold_set) if len(gold_set) else 0.0
+
+        results[category] = {
+            "strict": strict,
+            "proportional": prf(precision, recall),
+            "num_predicted": len(pred),
+            "num_gold": len(gold_set),
+            "num_unlocated": int(np.sum(pred.starts < 0)),
+        }
+
+    results["MACRO"] = {
+        mode: {metric: float(np.mean([results[c][mode][metric] for c in CATEGORIES]))
+               for metric in ["precision", "recall", "f1"]}
+        for mode in ["strict", "proportional"]
+    }
+    return results
+
+def print_report(results: Dict[str, Dict]) -> None:
+    header = f"{'category':<12} {'strict P':>9} {'strict R':>9} {'strict F1':>9} {'prop P':>9} {'prop R':>9} {'prop F1':>9}"
+    print(header)
+    print("-" * len(header))
+    for category in CATEGORIES + ["MACRO"]:
+        strict, proportional = results[category]["strict"], results[category]["proportional"]
+        print(f"{category:<12} {strict['precision']:>9.4f} {strict['recall']:>9.4f} {strict['f1']:>9.4f} "
+              f"{proportional['precision']:>9.4f} {proportional['recall']:>9.4f} {proportional['f1']:>9.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Strict and proportional span P/R/F1 against labelled_answer_spans.")
+    parser.add_argument("--pred", required=True, help="submission-format JSON file, or a directory of output_*.json")
+    parser.add_argument("--gold", required=True, help="JSON file with labelled_answer_spans, e.g. a validation split")
+    parser.add_argument("--output_file", default=None, help="optionally write the scores as JSON")
+    parser.add_argument("--align", action="store_true",
+                        help="align predicted spans to the gold answers first, so fuzzy matches get offsets")
+    parser.add_argument("--min_score", type=float, default=0.5, help="fuzzy-match threshold for --align")
+    args = parser.parse_args()
+
+    predictions = load_records(args.pred)
+    gold = load_records(args.gold)
+    if args.align:
+        from align_spans import align_records
+        predictions = align_records(predictions, gold, args.min_score)
+    start = time.perf_counter()
+    results = evaluate_spans(predictions, gold)
+    elapsed = time.perf_counter() - start
+    print_report(results)
+    print(f"\nScored {len(gold)} gold records in {elapsed * 1000:.1f} ms")
+
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,254 @@
+import json
+import argparse
+import hashlib
+import importlib
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from evaluate_spans import CATEGORIES, document_text, load_records
+
+def gold_summary(record: Dict, category: str) -> str:
+    """Reads a reference summary from either the labelled_summaries or the submission layout."""
+    if 'labelled_summaries' in record:
+        return record['labelled_summaries'].get(f"{category}_SUMMARY", "") or ""
+    return record.get('summaries', {}).get(category, "") or ""
+
+def text_digest(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{text}".encode('utf-8')).hexdigest()
+
+class EmbeddingScorer:
+    """
+    Cosine similarity of mean-pooled encoder embeddings, as in PerspectiveScorer.similarity.
+
+    Texts are embedded in length-sorted batches to keep padding low. Embeddings of
+    references are cached on disk by content hash (per model), so repeated runs over the
+    same dev set only embed the predictions.
+    """
+
+    def __init__(self, model_name: str = 'bert-base-uncased', device: str = 'cpu', batch_size: int = 32,
+                 cache_dir: Optional[str] = None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        self.torch = torch
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(device).eval()
+        self.cache_path = None
+        self.cache = {}
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            self.cache_path = Path(cache_dir) / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}.npz"
+            if self.cache_path.exists():
+                stored = np.load(self.cache_path)
+                self.cache = dict(zip(stored['keys'].tolist(), stored['vectors']))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        vectors = [None] * len(texts)
+        with self.torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                inputs = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                        max_length=512, return_tensors="pt").to(self.device)
+                hidden = self.model(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = ((hidden * mask).sum(dim=1) / mask.sum(dim=1)).float().cpu().numpy()
+                for i, vector in zip(batch, pooled):
+                    vectors[i] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_cached(self, texts: List[str]) -> np.ndarray:
+        keys = [text_digest(self.model_name, text) for text in texts]
+        missing = sorted({key: text for key, text in zip(keys, texts) if key not in self.cache}.items())
+        if missing:
+            for (key, _), vector in zip(missing, self.embed([text for _, text in missing])):
+                self.cache[key] = vector
+        return np.stack([self.cache[key] for key in keys])
+
+    def save_cache(self) -> None:
+        if self.cache_path is None or not self.cache:
+            return
+        keys = list(self.cache)
+        tmp_path = self.cache_path.with_name(self.cache_path.stem + ".tmp.npz")
+        np.savez(tmp_path, keys=np.array(keys), vectors=np.stack([self.cache[key] for key in keys]))
+        tmp_path.replace(self.cache_path)
+
+    def score(self, predictions: List[str], references: List[str]) -> np.ndarray:
+        pred = self.embed(predictions)
+        ref = self.embed_cached(references)
+        norms = np.linalg.norm(pred, axis=1) * np.linalg.norm(ref, axis=1)
+        return np.sum(pred * ref, axis=1) / np.maximum(norms, 1e-8)
+
+class TokenSupportScorer:
+    """Share of a summary's word tokens that occur in its source answers; a cheap model-free factuality proxy."""
+
+    def score(self, summaries: List[str], sources: List[str]) -> np.ndarray:
+        scores = np.zeros(len(summaries))
+        for i, (summary, source) in enumerate(zip(summaries, sources)):
+            tokens = re.findall(r"\w+", summary.lower())
+            if tokens:
+                vocabulary = set(re.findall(r"\w+", source.lower()))
+                scores[i] = sum(token in vocabulary for token in tokens) / len(tokens)
+        return scores
+
+class NLIScorer:
+    """Entailment probability of each summary given its source answers, from an MNLI classifier."""
+
+    def __init__(self, model_name: str = 'roberta-large-mnli', device: str = 'cpu', batch_size: int = 16):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        self.torch = torch
+        self.device = device
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device).eval()
+        labels = {label.lower(): i for i, label in self.model.config.id2label.items()}
+        self.entailment = labels.get('entailment', len(labels) - 1)
+
+    def score(self, summaries: List[str], sources: List[str]) -> np.ndarray:
+        scores = np.zeros(len(summaries))
+        with self.torch.no_grad():
+            for start in range(0, len(summaries), self.batch_size):
+                inputs = self.tokenizer(sources[start:start + self.batch_size], summaries[start:start + self.batch_size],
+                                        padding=True, truncation='only_first', max_length=512,
+                                        return_tensors="pt").to(self.device)
+                probabilities = self.torch.softmax(self.model(**inputs).logits.float(), dim=-1)
+                scores[start:start + self.batch_size] = probabilities[:, self.entailment].cpu().numpy()
+        return scores
+
+FACTUALITY_SCORERS = {
+    "token-support": lambda args: TokenSupportScorer(),
+    "nli": lambda args: NLIScorer(args.nli_model, args.device, args.batch_size),
+}
+
+def load_factuality_scorer(name: str, args: argparse.Namespace):
+    """
+    Builds a factuality scorer by registry name or "module:factory" path.
+
+    A factory takes the parsed arguments and returns an object with
+    score(summaries, sources) -> np.ndarray of per-summary scores.
+    """
+    if name in FACTUALITY_SCORERS:
+        return FACTUALITY_SCORERS[name](args)
+    module_name, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown factuality scorer {name}; use one of {sorted(FACTUALITY_SCORERS)} or module:factory")
+    return getattr(importlib.import_module(module_name), attribute)(args)
+
+def evaluate_summaries(predictions: List[Dict], gold: List[Dict],
+                       embedding_scorer: Optional[EmbeddingScorer] = None,
+                       factuality_scorer=None) -> Dict[str, Dict]:
+    """
+    Scores Task B summaries per perspective.
+
+    Pairs where the reference summary is empty are skipped. A pair whose prediction or
+    reference has no words (missing, empty or punctuation only) scores 0 on every metric. ROUGE is the mean of per-pair
+    F scores from the rouge package, as in train.py's validation_metrics. The model-based
+    metrics are computed for all perspectives in one batched pass.
+
+    Args:
+        predictions (List[Dict]): Entries with 'uri' and 'summaries', as produced by combine_json.py
+        gold (List[Dict]): Records with 'uri', 'answers' and 'labelled_summaries' (or 'summaries')
+        embedding_scorer (EmbeddingScorer): Optional embedding similarity scorer
+        factuality_scorer: Optional object with score(summaries, sources)
+
+    Returns:
+        Dict[str, Dict]: Metrics per category and their macro average
+    """
+    from rouge import Rouge
+
+    pred_by_uri = {int(entry['uri']): entry for entry in predictions}
+    rows = []
+    for record in gold:
+        entry = pred_by_uri.get(int(record['uri']), {})
+        source = document_text(record) if 'answers' in record or 'raw_text' in record else ""
+        for category in CATEGORIES:
+            reference = gold_summary(record, category).strip()
+            if not reference:
+                continue
+            prediction = (entry.get('summaries', {}).get(category, "") or "").strip()
+            rows.append((category, prediction, reference, source))
+
+    scores = {name: np.zeros(len(rows)) for name in ["rouge-1", "rouge-2", "rouge-l"]}
+    # The rouge package raises on a hypothesis or reference with no words (e.g. "..."), so such pairs score 0.
+    prediction_has_words = np.array([any(c.isalnum() for c in prediction) for _, prediction, _, _ in rows], dtype=bool)
+    reference_has_words = np.array([any(c.isalnum() for c in reference) for _, _, reference, _ in rows], dtype=bool)
+    scored = prediction_has_words & reference_has_words
+    index = np.flatnonzero(scored)
+    if len(index):
+        rouge_scores = Rouge().get_scores([rows[i][1] for i in index], [rows[i][2] for i in index])
+        for name in scores:
+            scores[name][index] = [score[name]["f"] for score in rouge_scores]
+    if embedding_scorer is not None:
+        scores["embedding_similarity"] = np.zeros(len(rows))
+        if len(index):
+            scores["embedding_similarity"][index] = embedding_scorer.score([rows[i][1] for i in index], [rows[i][2] for i in index])
+    if factuality_scorer is not None:
+        scores["factuality"] = np.zeros(len(rows))
+        if len(index):
+            scores["factuality"][index] = factuality_scorer.score([rows[i][1] for i in index], [rows[i][3] for i in index])
+
+    categories = np.array([category for category, _, _, _ in rows])
+    results = {}
+    for category in CATEGORIES:
+        mask = categories == category
+        results[category] = {name: float(values[mask].mean()) if mask.any() else 0.0 for name, values in scores.items()}
+        results[category]["num_pairs"] = int(mask.sum())
+        results[category]["num_empty_predictions"] = int((mask & ~prediction_has_words).sum())
+        results[category]["num_empty_references"] = int((mask & ~reference_has_words).sum())
+    results["MACRO"] = {name: float(np.mean([results[c][name] for c in CATEGORIES])) for name in scores}
+    return results
+
+def print_report(results: Dict[str, Dict]) -> None:
+    metrics = [name for name in results["MACRO"]]
+    header = f"{'category':<12}" + "".join(f" {name:>20}" for name in metrics) + f" {'pairs':>6}"
+    print(header)
+    print("-" * len(header))
+    for category in CATEGORIES + ["MACRO"]:
+        row = results[category]
+        pairs = f" {row['num_pairs']:>6}" if 'num_pairs' in row else ""
+        print(f"{category:<12}" + "".join(f" {row[name]:>20.4f}" for name in metrics) + pairs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corpus ROUGE, embedding similarity and factuality for Task B summaries.")
+    parser.add_argument("--pred", required=True, help="submission-format JSON file, or a directory of output_*.json")
+    parser.add_argument("--gold", required=True, help="JSON file with labelled_summaries, e.g. a validation split")
+    parser.add_argument("--embedding_model", default='bert-base-uncased', help="set to 'none' to skip embedding similarity")
+    parser.add_argument("--factuality", default='token-support',
+                        help="'none', a registered scorer (token-support, nli) or module:factory")
+    parser.add_argument("--nli_model", default='roberta-large-mnli')
+    parser.add_argument("--cache_dir", default='.embedding_cache', help="where reference embeddings are cached")
+    parser.add_argument("--device", default='cpu')
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--output_file", default=None, help="optionally write the scores as JSON")
+    args = parser.parse_args()
+
+    if args.num_threads is not None and (args.embedding_model != 'none' or args.factuality == 'nli'):
+        import torch
+        torch.set_num_threads(args.num_threads)
+
+    start = time.perf_counter()
+    embedding_scorer = None
+    if args.embedding_model != 'none':
+        embedding_scorer = EmbeddingScorer(args.embedding_model, args.device, args.batch_size, args.cache_dir)
+    factuality_scorer = None if args.factuality == 'none' else load_factuality_scorer(args.factuality, args)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = evaluate_summaries(load_records(args.pred), load_records(args.gold), embedding_scorer, factuality_scorer)
+    score_seconds = time.perf_counter() - start
+    if embedding_scorer is not None:
+        embedding_scorer.save_cache()
+
+    print_report(results)
+    print(f"\nModels loaded in {load_seconds:.1f}s, scored in {score_seconds:.2f}s")
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,227 @@
+import json
+import re
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reformat import format_example
+
+TOKEN = re.compile(r"\w+")
+
+def record_text(record: Dict) -> str:
+    """Text a record is retrieved by. The question is repeated so it outweighs long answer threads."""
+    return " ".join([record.get('question', '')] * 2 + [record.get('context', '')] + list(record.get('answers', [])))
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+class FewShotIndex:
+    """
+    BM25 index over labelled training records, used to pick few-shot examples per test record.
+
+    The index is an inverted CSR matrix stored as plain NumPy arrays: ``term_ptr`` (one
+    row per term), ``doc_ids`` and ``weights``. The weights hold the full BM25 term score
+    (idf times saturated term frequency), so scoring a query only gathers the rows of its
+    terms and sums them with ``np.bincount``. Records are kept as JSON lines with an offset
+    table, so only the selected examples are parsed. Every array is memory-mapped on load.
+
+    With a dense backend, L2-normalised mean-pooled encoder embeddings are stored as well,
+    and retrieval uses cosine similarity instead of BM25.
+    """
+
+    def __init__(self, index_dir: str, device: Optional[str] = None):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "meta.json", 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        # Device for the dense query encoder; defaults to the one the index was built on.
+        self.device = device or self.meta.get('device', 'cpu')
+        with open(self.index_dir / "vocab.json", 'r', encoding='utf-8') as f:
+            self.vocab = {term: i for i, term in enumerate(json.load(f))}
+        self.term_ptr = np.load(self.index_dir / "term_ptr.npy", mmap_mode='r')
+        self.doc_ids = np.load(self.index_dir / "doc_ids.npy", mmap_mode='r')
+        self.weights = np.load(self.index_dir / "weights.npy", mmap_mode='r')
+        self.record_offsets = np.load(self.index_dir / "record_offsets.npy", mmap_mode='r')
+        self.uris = np.load(self.index_dir / "uris.npy", mmap_mode='r')
+        self.dense = None
+        self.encoder = None
+        # Search results per (uri, text, k), since packing asks for the same records repeatedly.
+        self.hits = {}
+        if self.meta.get('dense_model'):
+            self.dense = np.load(self.index_dir / "dense.npy", mmap_mode='r')
+
+    @property
+    def num_docs(self) -> int:
+        return self.meta['num_docs']
+
+    @staticmethod
+    def build(records: List[Dict], index_dir: str, k1: float = 1.5, b: float = 0.75,
+              dense_model: Optional[str] = None, device: str = 'cpu') -> None:
+        """
+        Builds an index over records and saves it to index_dir.
+
+        Args:
+            records (List[Dict]): Labelled training records (uri, question, context, answers,
+                labelled_answer_spans, labelled_summaries)
+            index_dir (str): Output directory
+            k1 (float): BM25 term-frequency saturation
+            b (float): BM25 length normalisation
+            dense_model (str): Optional encoder name for the dense backend
+            device (str): Device for the dense encoder
+        """
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+
+        vocab, doc_terms, doc_lengths = {}, [], []
+        for record in records:
+            tokens = tokenize(record_text(record))
+            counts = {}
+            for token in tokens:
+                term = vocab.setdefault(token, len(vocab))
+                counts[term] = counts.get(term, 0) + 1
+            doc_terms.append(counts)
+            doc_lengths.append(len(tokens))
+
+        num_docs = len(records)
+        lengths = np.array(doc_lengths, dtype=np.float64)
+        avg_length = lengths.mean() if num_docs else 0.0
+        terms = np.array([term for counts in doc_terms for term in counts], dtype=np.int64)
+        docs = np.array([doc for doc, counts in enumerate(doc_terms) for _ in counts], dtype=np.int64)
+        tf = np.array([count for counts in doc_terms for count in counts.values()], dtype=np.float64)
+
+        df = np.bincount(terms, minlength=len(vocab))
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths[docs] / max(avg_length, 1e-9))
+        weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+
+        # Sort the (term, doc) pairs by term to get the inverted CSR layout.
+        order = np.lexsort((docs, terms))
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=term_ptr[1:])
+        np.save(index_dir / "term_ptr.npy", term_ptr)
+        np.save(index_dir / "doc_ids.npy", docs[order].astype(np.int32))
+        np.save(index_dir / "weights.npy", weights[order].astype(np.float32))
+        np.save(index_dir / "uris.npy", np.array([int(record['uri']) for record in records], dtype=np.int64))
+
+        offsets = [0]
+        with open(index_dir / "records.jsonl", 'wb') as f:
+            for record in records:
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+                offsets.append(f.tell())
+        np.save(index_dir / "record_offsets.npy", np.array(offsets, dtype=np.int64))
+
+        vocab_list = [None] * len(vocab)
+        for term, i in vocab.items():
+            vocab_list[i] = term
+        with open(index_dir / "vocab.json", 'w', encoding='utf-8') as f:
+            json.dump(vocab_list, f, ensure_ascii=False)
+
+        if dense_model:
+            from evaluate_summaries import EmbeddingScorer
+            encoder = EmbeddingScorer(dense_model, device)
+            vectors = encoder.embed([record_text(record) for record in records]).astype(np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+            np.save(index_dir / "dense.npy", vectors)
+
+        with open(index_dir / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({"num_docs": num_docs, "k1": k1, "b": b, "avg_length": avg_length,
+                       "dense_model": dense_model, "device": device}, f, indent=2)
+
+    def record(self, doc: int) -> Dict:
+        with open(self.index_dir / "records.jsonl", 'rb') as f:
+            f.seek(int(self.record_offsets[doc]))
+            return json.loads(f.read(int(self.record_offsets[doc + 1] - self.record_offsets[doc])))
+
+    def scores(self, record: Dict) -> np.ndarray:
+        """Similarity of record to every indexed record."""
+        if self.dense is not None:
+            if self.encoder is None:
+                from evaluate_summaries import EmbeddingScorer
+                self.encoder = EmbeddingScorer(self.meta['dense_model'], self.device)
+            query = self.encoder.embed([record_text(record)])[0]
+            return self.dense @ (query / max(np.linalg.norm(query), 1e-8))
+        terms = [self.vocab[token] for token in set(tokenize(record_text(record))) if token in self.vocab]
+        if not terms:
+            return np.zeros(self.num_docs, dtype=np.float32)
+        rows = [np.arange(self.term_ptr[term], self.term_ptr[term + 1]) for term in terms]
+        postings = np.concatenate(rows)
+        return np.bincount(self.doc_ids[postings], weights=self.weights[postings], minlength=self.num_docs)
+
+    def search(self, record: Dict, k: int = 3) -> List[Tuple[int, float]]:
+        """The k most similar indexed records as (row, score), best first; the record itself is excluded."""
+        scores = np.asarray(self.scores(record), dtype=np.float64)
+        scores[self.uris == int(record['uri'])] = -np.inf
+        k = min(k, self.num_docs)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(doc), float(scores[doc])) for doc in top if np.isfinite(scores[doc])]
+
+    def example_ids_for(self, records: List[Dict], k: int = 3, max_examples: Optional[int] = None) -> List[int]:
+        """
+        Rows of the examples for a request: each record's top-k, taken rank by rank across the
+        records so every record gets its best example first, without repeats and at most
+        max_examples in total.
+        """
+        hits = []
+        for record in records:
+            key = (str(record['uri']), record_text(record), k)
+            if key not in self.hits:
+                self.hits[key] = [doc for doc, _ in self.search(record, k)]
+            hits.append(self.hits[key])
+        seen, docs = set(), []
+        for rank in range(k):
+            for record_hits in hits:
+                if max_examples is not None and len(docs) >= max_examples:
+                    return docs
+                if rank < len(record_hits) and record_hits[rank] not in seen:
+                    seen.add(record_hits[rank])
+                    docs.append(record_hits[rank])
+        return docs
+
+    def examples_for(self, records: List[Dict], k: int = 3, max_examples: Optional[int] = None) -> List[Dict]:
+        """The examples selected by example_ids_for, as records."""
+        return [self.record(doc) for doc in self.example_ids_for(records, k, max_examples)]
+
+def render_prompt(prompt: str, examples: List[Dict]) -> str:
+    """Appends examples to an instruction prompt in the <examples> format written by reformat.py."""
+    if not examples:
+        return prompt
+    return prompt.rstrip() + "\n\n<examples>\n\n" + "".join(format_example(example) for example in examples) + "</examples>\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the few-shot example index over labelled training records.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--train_file", default="Train and Val/train_cleaned.json")
+    build_parser.add_argument("--index_dir", default="fewshot_index")
+    build_parser.add_argument("--k1", type=float, default=1.5)
+    build_parser.add_argument("--b", type=float, default=0.75)
+    build_parser.add_argument("--dense_model", default=None, help="e.g. bert-base-uncased; BM25 only when unset")
+    build_parser.add_argument("--device", default="cpu", help="device for the dense encoder")
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("--index_dir", default="fewshot_index")
+    query_parser.add_argument("--test_file", default="test_no_label.json")
+    query_parser.add_argument("--k", type=int, default=3)
+    query_parser.add_argument("--device", default=None, help="device for the dense query encoder; defaults to the build device")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.train_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        start = time.perf_counter()
+        FewShotIndex.build(records, args.index_dir, args.k1, args.b, args.dense_model, args.device)
+        print(f"Indexed {len(records)} records into {args.index_dir} in {time.perf_counter() - start:.2f}s")
+    else:
+        index = FewShotIndex(args.index_dir, args.device)
+        with open(args.test_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        start = time.perf_counter()
+        results = [index.search(record, args.k) for record in records]
+        elapsed = time.perf_counter() - start
+        for record, hits in zip(records, results):
+            print(f"{record['uri']}: " + ", ".join(f"{int(index.uris[doc])} ({score:.2f})" for doc, score in hits))
+        print(f"\n{len(records)} queries in {elapsed * 1000:.1f} ms ({elapsed * 1000 / max(len(records), 1):.2f} ms/query)")
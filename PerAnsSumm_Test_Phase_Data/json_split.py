@@ -1,6 +1,12 @@
 import json
+import re
+import argparse
+import hashlib
+import textwrap
 from pathlib import Path
-from typing import Union, Tuple, Set, Dict, Any
+from typing import Union, Tuple, Set, Dict, Any, Iterator, Optional
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
 
 def load_json_file(file_path: Path) -> Union[list, dict]:
     """Helper function to load a JSON file."""
@@ -120,13 +126,235 @@ def split_and_validate_json(file_path_str: str, n_splits: int) -> Tuple[Path, di
     
     return output_dir, validation_results
 
-# Example usage:
-try:
-    output_dir, validation = split_and_validate_json("test_no_label.json", 10)
-    print(f"Successfully split and validated JSON file.")
-    print(f"Output files are in: {output_dir}")
-    print("\nValidation results:")
-    for key, value in validation.items():
-        print(f"{key}: {value}")
-except Exception as e:
-    print(f"Error: {e}")
\ No newline at end of file
+def iter_json_array(file_path: Path, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Yields the top-level elements of a JSON array file one at a time.
+    
+    Only the current element and one read chunk are held in memory, so the file
+    can be far larger than RAM.
+    
+    Args:
+        file_path (Path): Path to a JSON file whose root is an array
+        chunk_size (int): Number of characters read per chunk
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer, idx, eof = "", 0, False
+        
+        def refill(size: int = chunk_size) -> None:
+            nonlocal buffer, idx, eof
+            chunk = f.read(size)
+            eof = not chunk
+            # Consumed text is only dropped here, so each character is copied a bounded number of times.
+            buffer = buffer[idx:] + chunk
+            idx = 0
+        
+        def skip_whitespace() -> None:
+            nonlocal idx
+            while True:
+                idx = WHITESPACE.match(buffer, idx).end()
+                if idx < len(buffer) or eof:
+                    return
+                refill()
+        
+        skip_whitespace()
+        if buffer[idx:idx + 1] != '[':
+            raise ValueError("Streaming split requires a JSON array at the root")
+        idx += 1
+        expect_item = True
+        while True:
+            skip_whitespace()
+            if idx >= len(buffer):
+                raise ValueError(f"Truncated or invalid JSON in {file_path}")
+            if buffer[idx] == ']':
+                return
+            if not expect_item:
+                if buffer[idx] != ',':
+                    raise ValueError(f"Expected ',' or ']' in {file_path}, found {buffer[idx:idx + 20]!r}")
+                idx += 1
+                expect_item = True
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, idx)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"Truncated or invalid JSON in {file_path}")
+                # The element spans past the end of the buffer; at least double what is buffered and retry.
+                refill(max(chunk_size, len(buffer) - idx))
+                continue
+            # A number cut by the chunk boundary decodes as a shorter one ("2." of "2.5e3"), so only
+            # accept it once a delimiter follows.
+            if (isinstance(item, (int, float)) and not isinstance(item, bool) and not eof
+                    and (end == len(buffer) or buffer[end] not in ' \t\n\r,]')):
+                refill()
+                continue
+            yield item
+            idx = end
+            expect_item = False
+
+def item_digest(item: Any) -> int:
+    """Content hash of a JSON item that does not depend on key order."""
+    canonical = json.dumps(item, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return int.from_bytes(hashlib.sha256(canonical).digest(), 'big')
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budget-based splitting (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+class DigestAccumulator:
+    """Order-independent fingerprint of a multiset of items: their count plus the sum of their hashes."""
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+    
+    def add(self, item: Any) -> None:
+        self.count += 1
+        self.total = (self.total + item_digest(item)) % (1 << 256)
+    
+    def __eq__(self, other) -> bool:
+        return self.count == other.count and self.total == other.total
+
+def stream_split_json(file_path_str: str,
+                      n_splits: Optional[int] = None,
+                      items_per_split: Optional[int] = None,
+                      max_bytes: Optional[int] = None,
+                      max_tokens: Optional[int] = None) -> Tuple[Path, dict]:
+    """
+    Splits a JSON array file into parts while streaming it, then validates the parts.
+    
+    Exactly one of the split criteria must be given. With n_splits the items are
+    counted in a first streaming pass and divided as in split_and_validate_json;
+    the other criteria start a new part whenever the next item would exceed the limit.
+    Validation re-streams the written parts and compares item counts and an
+    order-independent sum of per-item content hashes with the input.
+    
+    Args:
+        file_path_str (str): Path to the input JSON file
+        n_splits (int): Number of parts to split the file into
+        items_per_split (int): Maximum number of items per part
+        max_bytes (int): Maximum serialized size of a part in bytes
+        max_tokens (int): Maximum estimated token count of a part
+        
+    Returns:
+        Tuple[Path, dict]: Output directory path and validation results
+    """
+    input_path = Path(file_path_str)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file {file_path_str} not found")
+    
+    criteria = {"n_splits": n_splits, "items_per_split": items_per_split,
+                "max_bytes": max_bytes, "max_tokens": max_tokens}
+    given = {name: value for name, value in criteria.items() if value is not None}
+    if len(given) != 1:
+        raise ValueError("Exactly one of n_splits, items_per_split, max_bytes or max_tokens must be given")
+    for name, value in given.items():
+        if not isinstance(value, int) or value <= 0:
+            raise ValueError(f"{name} must be a positive integer")
+    
+    if n_splits is not None:
+        total_items = sum(1 for _ in iter_json_array(input_path))
+        if n_splits > total_items:
+            raise ValueError(f"Cannot split {total_items} items into {n_splits} parts")
+        chunk_size = total_items // n_splits
+    
+    output_dir = input_path.parent / f"{input_path.stem}_split"
+    output_dir.mkdir(exist_ok=True)
+    
+    original = DigestAccumulator()
+    split_files = []
+    out = None
+    part_items = part_bytes = part_tokens = 0
+    
+    def close_part():
+        if out is not None:
+            out.write("\n]")
+            out.close()
+    
+    try:
+        for item in iter_json_array(input_path):
+            original.add(item)
+            # Same layout as json.dump(chunk, indent=2): each item indented one level.
+            text = textwrap.indent(json.dumps(item, indent=2, ensure_ascii=False), '  ')
+            size = len(text.encode('utf-8')) + 2
+            tokens = estimate_tokens(text)
+            
+            if out is None:
+                start_new = True
+            elif n_splits is not None:
+                start_new = part_items == chunk_size and len(split_files) < n_splits
+            elif items_per_split is not None:
+                start_new = part_items >= items_per_split
+            elif max_bytes is not None:
+                start_new = part_bytes + size > max_bytes
+            else:
+                start_new = part_tokens + tokens > max_tokens
+            
+            if start_new:
+                close_part()
+                output_path = output_dir / f"{input_path.stem}_part{len(split_files) + 1}.json"
+                split_files.append(output_path)
+                out = open(output_path, 'w', encoding='utf-8')
+                out.write("[\n")
+                part_items = part_bytes = part_tokens = 0
+            else:
+                out.write(",\n")
+            out.write(text)
+            part_items += 1
+            part_bytes += size
+            part_tokens += tokens
+    finally:
+        close_part()
+    
+    # Validation phase: stream the parts back and compare fingerprints
+    split = DigestAccumulator()
+    for split_file in split_files:
+        for item in iter_json_array(split_file):
+            split.add(item)
+    
+    validation_results = {
+        "total_items_original": original.count,
+        "total_items_split": split.count,
+        "content_hash_match": original.total == split.total,
+        "is_valid": original == split,
+        "split_files_created": len(split_files)
+    }
+    
+    if not validation_results["is_valid"]:
+        raise ValueError(
+            f"Validation failed!\n"
+            f"Items in original: {original.count}\n"
+            f"Items in split files: {split.count}"
+        )
+    
+    return output_dir, validation_results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a JSON file into parts and validate the split.")
+    parser.add_argument("file", nargs="?", default="test_no_label.json")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the input instead of loading it into memory")
+    criteria = parser.add_mutually_exclusive_group()
+    criteria.add_argument("--n_splits", type=int, default=None)
+    criteria.add_argument("--items_per_split", type=int, default=None, help="requires --stream")
+    criteria.add_argument("--max_bytes", type=int, default=None, help="requires --stream")
+    criteria.add_argument("--max_tokens", type=int, default=None, help="requires --stream")
+    args = parser.parse_args()
+    
+    try:
+        if args.stream:
+            if not any([args.n_splits, args.items_per_split, args.max_bytes, args.max_tokens]):
+                args.n_splits = 10
+            output_dir, validation = stream_split_json(args.file, args.n_splits, args.items_per_split,
+                                                       args.max_bytes, args.max_tokens)
+        else:
+            if any([args.items_per_split, args.max_bytes, args.max_tokens]):
+                parser.error("--items_per_split, --max_bytes and --max_tokens require --stream")
+            output_dir, validation = split_and_validate_json(args.file, args.n_splits or 10)
+        print(f"Successfully split and validated JSON file.")
+        print(f"Output files are in: {output_dir}")
+        print("\nValidation results:")
+        for key, value in validation.items():
+            print(f"{key}: {value}")
+    except Exception as e:
+        print(f"Error: {e}")
\ No newline at end of file
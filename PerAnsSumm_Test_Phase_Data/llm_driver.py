@@ -0,0 +1,571 @@
+import json
+import os
+import re
+import time
+import random
+import hashlib
+import asyncio
+import argparse
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from combine_json import JSONValidationError, validate_and_fix_entry
+from json_split import estimate_tokens
+
+class TransientError(Exception):
+    """A failure worth retrying: rate limiting, a server error, a timeout or an unparseable reply."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ChatEndpoint:
+    """
+    Blocking client for a chat-completion endpoint.
+
+    api_style 'openai' posts {model, messages} to an OpenAI-compatible
+    /v1/chat/completions URL; 'anthropic' posts {model, system, messages} to a
+    /v1/messages URL. The instruction prompt is sent as the system message and the
+    records as the user message.
+    """
+
+    def __init__(self, url: str, model: str, api_style: str = 'openai', api_key: Optional[str] = None,
+                 max_tokens: int = 8192, temperature: float = 0.0, timeout: float = 600):
+        if api_style not in ('openai', 'anthropic'):
+            raise ValueError(f"Unknown api_style {api_style}")
+        self.url = url
+        self.model = model
+        self.api_style = api_style
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+
+    @property
+    def params(self) -> Dict:
+        """Everything besides the prompt and records that determines the reply."""
+        return {"model": self.model, "api_style": self.api_style,
+                "max_tokens": self.max_tokens, "temperature": self.temperature}
+
+    def build_request(self, system: str, user: str) -> urllib.request.Request:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_style == 'openai':
+            payload = {
+                "model": self.model,
+                "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
+                "max_tokens": self.max_tokens,
+                "temperature": self.temperature,
+            }
+            if self.api_key:
+                headers['Authorization'] = f"Bearer {self.api_key}"
+        else:
+            payload = {
+                "model": self.model,
+                "system": system,
+                "messages": [{"role": "user", "content": user}],
+                "max_tokens": self.max_tokens,
+                "temperature": self.temperature,
+            }
+            headers['anthropic-version'] = '2023-06-01'
+            if self.api_key:
+                headers['x-api-key'] = self.api_key
+        return urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'), headers=headers)
+
+    def parse_response(self, payload: Dict) -> str:
+        if self.api_style == 'openai':
+            return payload['choices'][0]['message']['content']
+        return "".join(block.get('text', '') for block in payload['content'])
+
+    def post(self, system: str, user: str) -> str:
+        try:
+            with urllib.request.urlopen(self.build_request(system, user), timeout=self.timeout) as response:
+                return self.parse_response(json.load(response))
+        except urllib.error.HTTPError as e:
+            body = e.read().decode('utf-8', 'replace')[:500]
+            if e.code == 429 or e.code >= 500:
+                retry_after = e.headers.get('Retry-After')
+                raise TransientError(f"HTTP {e.code}: {body}", float(retry_after) if retry_after else None)
+            raise RuntimeError(f"HTTP {e.code}: {body}") from e
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise TransientError(f"Connection failed: {e}")
+
+class TokenBucket:
+    """
+    Async token bucket: ``rate_per_minute`` units refill continuously up to ``capacity``.
+
+    Waiters are served in arrival order. A single request larger than the capacity
+    waits for a full bucket instead of blocking forever.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+def extract_json_array(text: str) -> List:
+    """Parses the JSON array in a model reply, tolerating code fences and surrounding prose."""
+    fenced = re.search(r"```(?:json)?\s*(\[.*\])\s*```", text, re.DOTALL)
+    candidate = fenced.group(1) if fenced else text[text.find('['):text.rfind(']') + 1]
+    if not candidate:
+        raise ValueError("No JSON array found in the reply")
+    data = json.loads(candidate)
+    if not isinstance(data, list):
+        raise ValueError("Reply is not a JSON array")
+    return data
+
+def extract_entries(text: str) -> List:
+    """
+    Like extract_json_array, but recovers every complete entry from a reply that was cut
+    off or otherwise malformed, so a packed request only has to re-send what is missing.
+    """
+    try:
+        return extract_json_array(text)
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    entries, position = [], 0
+    while True:
+        start = text.find('{', position)
+        if start < 0:
+            break
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            position = start + 1
+            continue
+        if isinstance(value, dict) and 'uri' in value:
+            entries.append(value)
+            position = end
+        else:
+            position = start + 1
+    if not entries:
+        raise ValueError("No entries found in the reply")
+    return entries
+
+PACK_HEADER = (
+    "The {n} records below are independent. Each is enclosed in <record uri=\"...\"> and </record> tags. "
+    "Process every record separately and return ONE JSON array with exactly one entry per record, "
+    "in the same order, each with the record's uri."
+)
+
+def pack_records(records: List[Dict], max_tokens: int, max_records: int,
+                 extra_tokens: Optional[Callable[[List[Dict]], int]] = None,
+                 base_tokens: int = 0) -> List[List[Dict]]:
+    """
+    Groups records, in order, into packs whose estimated request size fits max_tokens.
+
+    base_tokens is the part of every request that does not depend on its records (the
+    instruction prompt and PACK_HEADER). extra_tokens(pack), when given, estimates the
+    part that does (the retrieved few-shot examples). Both count toward the budget.
+    A record that does not fit on its own becomes a pack of one.
+    """
+    packs, current, current_tokens = [], [], base_tokens
+    for record in records:
+        tokens = estimate_tokens(json.dumps(record, indent=2, ensure_ascii=False)) + 16
+        if current and (len(current) >= max_records or current_tokens + tokens
+                        + (extra_tokens(current + [record]) if extra_tokens is not None else 0) > max_tokens):
+            packs.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(record)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def prompt_digest(prompt: str) -> str:
+    """Default prompt version: a short hash of the prompt text, so any edit starts a new version."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+
+def output_name(shard_path: Path) -> str:
+    """test_no_label_part3.json -> output_3.json, the layout combine_json.py reads."""
+    stem = shard_path.stem.rsplit('part', 1)
+    number = stem[1] if len(stem) == 2 and stem[1].isdigit() else shard_path.stem
+    return f"output_{number}.json"
+
+class Driver:
+    """
+    Sends record shards with the instruction prompt to a chat endpoint concurrently.
+
+    At most ``concurrency`` requests are in flight, and requests and estimated input
+    tokens are rate limited with token buckets. Transient failures and unparseable
+    replies are retried with full-jitter exponential backoff (or the server's
+    Retry-After), and records missing from a reply are re-sent alone. Each shard's
+    validated entries are written to its output_N.json as soon as they are complete.
+
+    With a ``cache`` (see response_cache.py), output entries are cached per record under
+    ``prompt_version``: a record already answered for the same prompt, record JSON, model
+    and sampling parameters is served from the cache, and only the other records of a
+    shard or pack are sent.
+
+    With a ``fewshot_index`` (see fewshot_index.py), the ``fewshot_k`` most similar
+    training examples of each record in a request, at most ``fewshot_max_examples`` in
+    total, are appended to its prompt. Packs count those examples toward their budget.
+    """
+
+    def __init__(self, endpoint: ChatEndpoint, prompt: str, output_dir: str, concurrency: int = 4,
+                 requests_per_minute: float = 50, tokens_per_minute: float = 100000,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 cache=None, prompt_version: Optional[str] = None, fewshot_index=None, fewshot_k: int = 3,
+                 fewshot_max_examples: Optional[int] = None):
+        self.endpoint = endpoint
+        self.prompt = prompt
+        self.output_dir = Path(output_dir)
+        self.concurrency = concurrency
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = cache
+        self.fewshot_index = fewshot_index
+        self.fewshot_k = fewshot_k
+        self.fewshot_max_examples = fewshot_max_examples
+        self.example_sizes = {}
+        self.prompt_version = prompt_version or prompt_digest(prompt)
+        self.stats = {"requests": 0, "retries": 0, "input_tokens": 0, "cache_hits": 0}
+
+    def user_message(self, records: List[Dict]) -> str:
+        return json.dumps(records, indent=2, ensure_ascii=False)
+
+    def packed_message(self, records: List[Dict]) -> str:
+        parts = [PACK_HEADER.format(n=len(records))]
+        for record in records:
+            parts.append(f'<record uri="{record["uri"]}">\n{json.dumps(record, indent=2, ensure_ascii=False)}\n</record>')
+        return "\n\n".join(parts)
+
+    def prompt_for(self, records: List[Dict]) -> str:
+        if self.fewshot_index is None:
+            return self.prompt
+        from fewshot_index import render_prompt
+        return render_prompt(self.prompt, self.fewshot_index.examples_for(records, self.fewshot_k, self.fewshot_max_examples))
+
+    def example_tokens(self, records: List[Dict]) -> int:
+        """Estimated tokens the retrieved examples add to the prompt of a request for records."""
+        from reformat import format_example
+        docs = self.fewshot_index.example_ids_for(records, self.fewshot_k, self.fewshot_max_examples)
+        for doc in docs:
+            if doc not in self.example_sizes:
+                self.example_sizes[doc] = estimate_tokens(format_example(self.fewshot_index.record(doc)))
+        # Plus the <examples> wrapper added by render_prompt.
+        return sum(self.example_sizes[doc] for doc in docs) + 8 if docs else 0
+
+    def pack_overhead_tokens(self) -> int:
+        """Estimated tokens every packed request carries regardless of its records."""
+        return estimate_tokens(self.prompt) + estimate_tokens(PACK_HEADER.format(n=len(PACK_HEADER)))
+
+    async def request(self, prompt: str, user: str) -> str:
+        """One completion, rate limited and bounded by the concurrency semaphore (no retries)."""
+        tokens = estimate_tokens(prompt) + estimate_tokens(user)
+        await self.request_bucket.acquire(1)
+        await self.token_bucket.acquire(tokens)
+        async with self.semaphore:
+            self.stats["requests"] += 1
+            self.stats["input_tokens"] += tokens
+            return await asyncio.to_thread(self.endpoint.post, prompt, user)
+
+    def cache_key(self, record: Dict) -> str:
+        params = dict(self.endpoint.params)
+        if self.fewshot_index is not None:
+            # Retrieved examples change the prompt, so they are part of the key.
+            params["fewshot"] = {"index": self.fewshot_index.meta, "k": self.fewshot_k,
+                                 "max_examples": self.fewshot_max_examples}
+        return self.cache.make_key(self.prompt, record, params)
+
+    def cache_entries(self, keys: Dict[int, str], entries: List, label: str) -> None:
+        """Stores every valid entry of a fresh reply under the key of its record."""
+        for i, entry in enumerate(entries, 1):
+            try:
+                uri = validate_and_fix_entry(entry, label, i)['uri'] if isinstance(entry, dict) else None
+            except JSONValidationError:
+                continue
+            if uri in keys:
+                self.cache.put(keys.pop(uri), json.dumps(entry, ensure_ascii=False), self.prompt_version, [uri])
+
+    async def complete(self, records: List[Dict], label: str, packed: bool = False) -> List:
+        """
+        Requests entries for records, retrying transient failures and malformed replies.
+
+        Records with a cached entry are not sent; their entries are returned along with
+        those of the reply.
+        """
+        cached, pending, keys = [], [], {}
+        for record in records:
+            if self.cache is not None:
+                key = self.cache_key(record)
+                value = self.cache.get(key)
+                if value is not None:
+                    try:
+                        cached.append(json.loads(value))
+                        self.stats["cache_hits"] += 1
+                        continue
+                    except ValueError:
+                        pass
+                keys[int(record['uri'])] = key
+            pending.append(record)
+        if not pending:
+            return cached
+
+        prompt = self.prompt_for(pending)
+        user = self.packed_message(pending) if packed else self.user_message(pending)
+        parse = extract_entries if packed else extract_json_array
+        for attempt in range(self.max_retries + 1):
+            try:
+                reply = await self.request(prompt, user)
+                entries = parse(reply)
+                if self.cache is not None:
+                    self.cache_entries(keys, entries, label)
+                return cached + entries
+            except (TransientError, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"{label} failed after {attempt + 1} attempts: {e}")
+                retry_after = getattr(e, 'retry_after', None)
+                delay = retry_after if retry_after is not None else random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                self.stats["retries"] += 1
+                print(f"{label}: {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def validate(self, records: List[Dict], entries: List, file_name: str) -> Tuple[List[Dict], List[str]]:
+        """Fixes entries with validate_and_fix_entry and reports invalid, unexpected and missing URIs."""
+        expected = {int(record['uri']) for record in records}
+        fixed, errors, seen = [], [], set()
+        for i, entry in enumerate(entries, 1):
+            try:
+                fixed_entry = validate_and_fix_entry(entry, file_name, i) if isinstance(entry, dict) else None
+            except JSONValidationError as e:
+                errors.append(str(e))
+                continue
+            if fixed_entry is None:
+                errors.append(f"Entry {i} in {file_name} is not an object")
+            elif fixed_entry['uri'] not in expected:
+                errors.append(f"Unexpected URI {fixed_entry['uri']} in {file_name}, entry {i}")
+            elif fixed_entry['uri'] not in seen:
+                seen.add(fixed_entry['uri'])
+                fixed.append(fixed_entry)
+        errors.extend(f"Missing URI {uri} in {file_name}" for uri in sorted(expected - seen))
+        # Keep the input order, which the prompt asks for but models do not always follow.
+        order = {int(record['uri']): i for i, record in enumerate(records)}
+        fixed.sort(key=lambda entry: order[entry['uri']])
+        return fixed, errors
+
+    def write(self, path: Path, entries: List[Dict]) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    async def run_shard(self, shard_path: Path) -> Tuple[str, int, List[str]]:
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        output_path = self.output_dir / output_name(shard_path)
+        start = time.perf_counter()
+        entries = await self.complete(records, shard_path.name)
+        fixed, errors = self.validate(records, entries, output_path.name)
+        found = {entry['uri'] for entry in fixed}
+        missing = [record for record in records if int(record['uri']) not in found]
+        if missing:
+            # Records the reply left out or got wrong are re-sent alone, as in run_packed.
+            print(f"{shard_path.name}: re-sending {len(missing)} of {len(records)} records alone")
+            retried = await asyncio.gather(*(self.complete([record], f"{shard_path.name} uri {record['uri']}")
+                                             for record in missing), return_exceptions=True)
+            failures = [str(result) for result in retried if isinstance(result, Exception)]
+            entries = entries + [entry for result in retried if not isinstance(result, Exception) for entry in result]
+            fixed, errors = self.validate(records, entries, output_path.name)
+            errors = failures + errors
+        self.write(output_path, fixed)
+        print(f"{shard_path.name} -> {output_path.name}: {len(fixed)}/{len(records)} entries in {time.perf_counter() - start:.1f}s")
+        return output_path.name, len(fixed), errors
+
+    async def run_packed(self, shards: List[Path], max_tokens: int, max_records: int = 20,
+                         overwrite: bool = False) -> List[str]:
+        """
+        Packs the records of every shard into as few requests as fit max_tokens.
+
+        max_tokens bounds the whole estimated request: instruction prompt, pack header,
+        records and retrieved examples. The instruction prompt is then paid once per pack
+        rather than once per shard.
+        Replies are split back per URI and validated; records that come back missing or
+        invalid are re-sent alone. Each shard's output_N.json is written as soon as all of
+        its records are resolved. Returns the errors.
+        """
+        overhead = self.pack_overhead_tokens()
+        if overhead >= max_tokens:
+            raise ValueError(f"The instruction prompt alone is ~{overhead} tokens; a pack budget of {max_tokens} leaves no room for records")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        todo = [shard for shard in shards if overwrite or not (self.output_dir / output_name(shard)).exists()]
+        if len(todo) < len(shards):
+            print(f"Skipping {len(shards) - len(todo)} shards with existing outputs")
+
+        shard_records, shard_of, remaining = {}, {}, {}
+        for shard in todo:
+            with open(shard, 'r', encoding='utf-8') as f:
+                shard_records[shard] = json.load(f)
+            remaining[shard] = len(shard_records[shard])
+            for record in shard_records[shard]:
+                shard_of[int(record['uri'])] = shard
+        records = [record for shard in todo for record in shard_records[shard]]
+        results, errors = {}, []
+
+        def resolve(uris):
+            for uri in uris:
+                shard = shard_of[uri]
+                remaining[shard] -= 1
+                if remaining[shard] == 0:
+                    entries = [results[int(r['uri'])] for r in shard_records[shard] if int(r['uri']) in results]
+                    self.write(self.output_dir / output_name(shard), entries)
+                    print(f"{shard.name} -> {output_name(shard)}: {len(entries)}/{len(shard_records[shard])} entries")
+
+        async def send(pack, label, alone):
+            try:
+                entries = await self.complete(pack, label, packed=not alone)
+            except RuntimeError as e:
+                if alone:
+                    errors.append(str(e))
+                    resolve([int(pack[0]['uri'])])
+                    return
+                entries = []
+            fixed, pack_errors = self.validate(pack, entries, label)
+            for entry in fixed:
+                results[entry['uri']] = entry
+            resolve([entry['uri'] for entry in fixed])
+            missing = [record for record in pack if int(record['uri']) not in results]
+            if alone:
+                errors.extend(pack_errors)
+                resolve([int(record['uri']) for record in missing])
+            elif missing:
+                print(f"{label}: re-sending {len(missing)} of {len(pack)} records alone")
+                await asyncio.gather(*(send([record], f"uri {record['uri']}", True) for record in missing))
+
+        packs = pack_records(records, max_tokens, max_records,
+                             self.example_tokens if self.fewshot_index is not None else None,
+                             self.pack_overhead_tokens())
+        print(f"{len(records)} records in {len(packs)} packs")
+        await asyncio.gather(*(send(pack, f"pack {i} ({len(pack)} records)", len(pack) == 1)
+                               for i, pack in enumerate(packs, 1)))
+        return errors
+
+    async def run(self, shards: List[Path], overwrite: bool = False) -> List[str]:
+        """Runs every shard and returns the errors; existing outputs are skipped unless overwrite is set."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        todo = [shard for shard in shards if overwrite or not (self.output_dir / output_name(shard)).exists()]
+        if len(todo) < len(shards):
+            print(f"Skipping {len(shards) - len(todo)} shards with existing outputs")
+        results = await asyncio.gather(*(self.run_shard(shard) for shard in todo), return_exceptions=True)
+        errors = []
+        for shard, result in zip(todo, results):
+            if isinstance(result, Exception):
+                errors.append(f"{shard.name}: {result}")
+            else:
+                errors.extend(result[2])
+        return errors
+
+def shard_number(path: Path) -> int:
+    stem = path.stem.rsplit('part', 1)
+    return int(stem[1]) if len(stem) == 2 and stem[1].isdigit() else 0
+
+def find_shards(shard_dir: str) -> List[Path]:
+    return sorted(Path(shard_dir).glob("*_part*.json"), key=shard_number)
+
+def add_request_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Options that determine the replies, and so the response cache keys. combine_json.py
+    takes the same options to look up cached entries for a run.
+    """
+    group = parser.add_argument_group("request")
+    group.add_argument("--prompt_file", default="../Full_Prompt.txt")
+    group.add_argument("--url", default="http://127.0.0.1:8766/v1/chat/completions",
+                       help="defaults to llm_stub_server.py")
+    group.add_argument("--api_style", choices=['openai', 'anthropic'], default='openai')
+    group.add_argument("--model", default="stub")
+    group.add_argument("--api_key_env", default="LLM_API_KEY", help="environment variable holding the API key")
+    group.add_argument("--max_tokens", type=int, default=8192)
+    group.add_argument("--temperature", type=float, default=0.0)
+    group.add_argument("--fewshot_index", default=None, help="directory built by fewshot_index.py; adds retrieved examples to each prompt")
+    group.add_argument("--fewshot_k", type=int, default=3)
+    group.add_argument("--fewshot_max_examples", type=int, default=8,
+                       help="cap on retrieved examples per request; with packing they also count toward --pack_tokens")
+
+def driver_from_args(args: argparse.Namespace, output_dir: str, cache=None, **kwargs) -> Driver:
+    """Builds a Driver from the add_request_args options; kwargs go to Driver."""
+    with open(args.prompt_file, 'r', encoding='utf-8') as f:
+        prompt = f.read()
+    endpoint = ChatEndpoint(args.url, args.model, args.api_style, os.environ.get(args.api_key_env),
+                            args.max_tokens, args.temperature)
+    fewshot = None
+    if args.fewshot_index is not None:
+        from fewshot_index import FewShotIndex
+        fewshot = FewShotIndex(args.fewshot_index)
+    return Driver(endpoint, prompt, output_dir, cache=cache, fewshot_index=fewshot, fewshot_k=args.fewshot_k,
+                  fewshot_max_examples=args.fewshot_max_examples, **kwargs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the self-prompting pipeline over record shards against a chat endpoint.")
+    parser.add_argument("--shard_dir", default="test_no_label_split")
+    parser.add_argument("--output_dir", default="llm_answers/spans")
+    add_request_args(parser)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=50, help="requests per minute")
+    parser.add_argument("--tpm", type=float, default=100000, help="estimated input tokens per minute")
+    parser.add_argument("--max_retries", type=int, default=5)
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--pack_tokens", type=int, default=0,
+                        help="pack records from all shards into requests of at most about this many estimated tokens, "
+                             "instruction prompt included; 0 sends one request per shard")
+    parser.add_argument("--pack_max_records", type=int, default=20, help="cap per pack, to keep replies within --max_tokens")
+    parser.add_argument("--cache_dir", default=".llm_cache", help="response cache; 'none' disables it")
+    parser.add_argument("--cache_max_mb", type=float, default=512)
+    parser.add_argument("--prompt_version", default=None, help="label for cached replies; defaults to a hash of the prompt")
+    args = parser.parse_args()
+
+    shards = find_shards(args.shard_dir)
+    if not shards:
+        parser.error(f"No *_part*.json shards found in {args.shard_dir}")
+
+    cache = None
+    if args.cache_dir != 'none':
+        from response_cache import ResponseCache
+        cache = ResponseCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    driver = driver_from_args(args, args.output_dir, cache, concurrency=args.concurrency,
+                              requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                              max_retries=args.max_retries, prompt_version=args.prompt_version)
+    if 0 < args.pack_tokens <= driver.pack_overhead_tokens():
+        parser.error(f"--pack_tokens {args.pack_tokens} does not exceed the ~{driver.pack_overhead_tokens()}-token "
+                     f"instruction prompt; raise it or pass 0 to send one request per shard")
+    start = time.perf_counter()
+    try:
+        if args.pack_tokens > 0:
+            errors = asyncio.run(driver.run_packed(shards, args.pack_tokens, args.pack_max_records, args.overwrite))
+        else:
+            errors = asyncio.run(driver.run(shards, args.overwrite))
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"\n{driver.stats['requests']} requests ({driver.stats['retries']} retries, "
+          f"{driver.stats['cache_hits']} records from the cache, ~{driver.stats['input_tokens']} input tokens) "
+          f"in {time.perf_counter() - start:.1f}s (prompt version {driver.prompt_version})")
+    num_records = 0
+    for shard in shards:
+        with open(shard, 'r', encoding='utf-8') as f:
+            num_records += len(json.load(f))
+    print(f"~{driver.stats['input_tokens'] / max(num_records, 1):.0f} input tokens per record")
+    if errors:
+        print("\nWarnings/Errors encountered:")
+        for error in errors:
+            print(f"- {error}")
@@ -0,0 +1,98 @@
+import json
+import re
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+CATEGORIES = ['EXPERIENCE', 'INFORMATION', 'CAUSE', 'SUGGESTION', 'QUESTION']
+
+def find_records(text: str) -> List[Dict]:
+    """Every JSON object with a 'uri' in the user message, in order."""
+    decoder = json.JSONDecoder()
+    records, position = [], 0
+    while True:
+        start = text.find('{', position)
+        if start < 0:
+            return records
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            position = start + 1
+            continue
+        if isinstance(value, dict) and 'uri' in value:
+            records.append(value)
+            position = end
+        else:
+            position = start + 1
+
+def fake_entry(record: Dict) -> Dict:
+    """A well-formed entry whose spans are real sentences from the answers."""
+    sentences = [s.strip() for answer in record.get('answers', []) for s in re.split(r"(?<=[.!?])\s+", answer) if s.strip()]
+    spans = {category: [] for category in CATEGORIES}
+    summaries = {category: "" for category in CATEGORIES}
+    for i, sentence in enumerate(sentences[:4]):
+        category = CATEGORIES[i % 4]
+        spans[category].append(sentence)
+        summaries[category] = summaries[category] or f"For information purposes, {sentence[:120]}"
+    return {"uri": str(record['uri']), "spans": spans, "summaries": summaries}
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            time.sleep(random.uniform(0, 2 * args.latency_ms) / 1000)
+            roll = random.random()
+            if roll < args.rate_limit_rate:
+                self._reply(429, {'error': 'rate limited'}, {'Retry-After': '0.1'})
+                return
+            if roll < args.rate_limit_rate + args.error_rate:
+                self._reply(500, {'error': 'internal error'})
+                return
+
+            user = payload['messages'][-1]['content']
+            entries = [fake_entry(record) for record in find_records(user)]
+            roll -= args.rate_limit_rate + args.error_rate
+            if roll < args.drop_rate and len(entries) > 1:
+                entries.pop(random.randrange(len(entries)))
+            text = f"Here are the results:\n```json\n{json.dumps(entries, indent=2, ensure_ascii=False)}\n```"
+            if args.drop_rate <= roll < args.drop_rate + args.garble_rate:
+                text = text[:len(text) // 2]
+
+            if self.path.endswith('/messages'):
+                self._reply(200, {'content': [{'type': 'text', 'text': text}], 'model': payload.get('model')})
+            else:
+                self._reply(200, {'choices': [{'message': {'role': 'assistant', 'content': text}}], 'model': payload.get('model')})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for a chat-completion endpoint, for testing llm_driver.py.")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency_ms", type=float, default=200, help="mean simulated response latency")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--drop_rate", type=float, default=0.0, help="share of replies missing one record")
+    parser.add_argument("--garble_rate", type=float, default=0.0, help="share of replies cut off mid-JSON")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Stub chat endpoint on http://{args.host}:{args.port} (/v1/chat/completions and /v1/messages)")
+    server.serve_forever()
@@ -2,12 +2,78 @@ import json
 import os
 from pathlib import Path
 
+from corpus_store import load_corpus
+
+def format_example(qa_json):
+    """
+    Renders one labelled QA pair as an <example> block for the prompt.
+    
+    Args:
+        qa_json (dict): Record with uri, question, context, answers and optionally
+            labelled_answer_spans and labelled_summaries
+        
+    Returns:
+        str: The <example> block, followed by a blank line
+    """
+    # Extract input components
+    input_format = {
+        "uri": qa_json["uri"],
+        "question": qa_json["question"].replace('"', '\\"'),
+        "context": qa_json["context"].replace('"', '\\"'),
+        "answers": qa_json["answers"]
+    }
+    
+    # Initialize spans
+    spans = {
+        "EXPERIENCE": [],
+        "INFORMATION": [],
+        "CAUSE": [],
+        "SUGGESTION": [],
+        "QUESTION": []
+    }
+    
+    # Extract spans
+    for category in qa_json.get("labelled_answer_spans", {}):
+        spans[category] = [item["txt"] for item in qa_json["labelled_answer_spans"][category]]
+    
+    # Extract summaries
+    summaries = {
+        "EXPERIENCE": qa_json.get("labelled_summaries", {}).get("EXPERIENCE_SUMMARY", ""),
+        "INFORMATION": qa_json.get("labelled_summaries", {}).get("INFORMATION_SUMMARY", ""),
+        "CAUSE": qa_json.get("labelled_summaries", {}).get("CAUSE_SUMMARY", ""),
+        "SUGGESTION": qa_json.get("labelled_summaries", {}).get("SUGGESTION_SUMMARY", ""),
+        "QUESTION": qa_json.get("labelled_summaries", {}).get("QUESTION_SUMMARY", "")
+    }
+    
+    # Create output format
+    output_format = {
+        "uri": int(qa_json["uri"]),
+        "spans": spans,
+        "summaries": summaries
+    }
+    
+    # Write example with proper formatting
+    return f"""<example>
+<input>
+    "uri": {input_format['uri']},
+    "question": "{input_format['question']}",
+    "context": "{input_format['context']}",
+    "answers": {json.dumps(input_format['answers'], indent=6)}
+</input>
+
+<output>
+{json.dumps(output_format, indent=4)}
+</output>
+</example>
+
+"""
+
 def format_qa_pairs(input_file, output_file):
     """
     Formats multiple medical Q&A pairs and writes them to a file.
     
     Args:
-        input_file (str): Path to input JSON file
+        input_file (str): Path to input JSON file or corpus store directory
         output_file (str): Path to output file
         
     Returns:
@@ -30,12 +96,8 @@ def format_qa_pairs(input_file, output_file):
             print(f"Warning: Could not create backup: {str(e)}")
     
     try:
-        # Read input file with UTF-8 encoding
-        with open(input_file, 'r', encoding='utf-8') as f:
-            qa_json_list = json.load(f)
-            
-        if not isinstance(qa_json_list, list):
-            qa_json_list = [qa_json_list]
+        # Read input file or store; the prompt examples never use raw_text
+        qa_json_list = load_corpus(input_file, exclude=['raw_text'])
         
         with open(output_file, 'w', encoding='utf-8') as f:
             # Write opening tag
@@ -47,58 +109,7 @@ def format_qa_pairs(input_file, output_file):
             # Process each QA pair
             for i, qa_json in enumerate(qa_json_list, 1):
                 try:
-                    # Extract input components
-                    input_format = {
-                        "uri": qa_json["uri"],
-                        "question": qa_json["question"].replace('"', '\\"'),
-                        "context": qa_json["context"].replace('"', '\\"'),
-                        "answers": qa_json["answers"]
-                    }
-                    
-                    # Initialize spans
-                    spans = {
-                        "EXPERIENCE": [],
-                        "INFORMATION": [],
-                        "CAUSE": [],
-                        "SUGGESTION": [],
-                        "QUESTION": []
-                    }
-                    
-                    # Extract spans
-                    for category in qa_json.get("labelled_answer_spans", {}):
-                        spans[category] = [item["txt"] for item in qa_json["labelled_answer_spans"][category]]
-                    
-                    # Extract summaries
-                    summaries = {
-                        "EXPERIENCE": qa_json.get("labelled_summaries", {}).get("EXPERIENCE_SUMMARY", ""),
-                        "INFORMATION": qa_json.get("labelled_summaries", {}).get("INFORMATION_SUMMARY", ""),
-                        "CAUSE": qa_json.get("labelled_summaries", {}).get("CAUSE_SUMMARY", ""),
-                        "SUGGESTION": qa_json.get("labelled_summaries", {}).get("SUGGESTION_SUMMARY", ""),
-                        "QUESTION": qa_json.get("labelled_summaries", {}).get("QUESTION_SUMMARY", "")
-                    }
-                    
-                    # Create output format
-                    output_format = {
-                        "uri": int(qa_json["uri"]),
-                        "spans": spans,
-                        "summaries": summaries
-                    }
-                    
-                    # Write example with proper formatting
-                    example = f"""<example>
-<input>
-    "uri": {input_format['uri']},
-    "question": "{input_format['question']}",
-    "context": "{input_format['context']}",
-    "answers": {json.dumps(input_format['answers'], indent=6)}
-</input>
-
-<output>
-{json.dumps(output_format, indent=4)}
-</output>
-</example>
-
-"""
+                    example = format_example(qa_json)
                     f.write(example)
                     successful += 1
                     
@@ -120,8 +131,9 @@ def format_qa_pairs(input_file, output_file):
         return False
 
 # Usage example - now takes input file path
-input_file = 'Train and Val/train_cleaned.json'  # Update this to your input file path
-output_file = 'reformatted_answers.json'
-success = format_qa_pairs(input_file, output_file)
-if success:
-    print("File written successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    input_file = 'Train and Val/train_cleaned.json'  # Update this to your input file path
+    output_file = 'reformatted_answers.json'
+    success = format_qa_pairs(input_file, output_file)
+    if success:
+        print("File written successfully!")
\ No newline at end of file
@@ -0,0 +1,260 @@
+import json
+import os
+import time
+import zlib
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM output entries, one per record.
+
+    Each record's entry is keyed by a hash of the prompt text, that record's JSON, the
+    model name and the sampling parameters, so editing one record only misses that record
+    and a shard or pack can be assembled from per-record hits. Entries are
+    zlib-compressed and appended to ``responses.log``,
+    each behind a one-line JSON header, and located through ``index.json`` (offset,
+    length, prompt version, URIs, last use). The log is never rewritten in place:
+    evictions and invalidations append tombstones, and ``compact`` copies the live
+    entries to a fresh log. If the index is missing or out of date it is rebuilt by
+    scanning the log.
+
+    When the compressed size of the live entries exceeds ``max_bytes``, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.cache_dir / "responses.log"
+        self.index_path = self.cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = {}
+        self.dirty = False
+        self._load()
+        self.data = open(self.data_path, 'ab')
+
+    @staticmethod
+    def make_key(prompt: str, record: Dict, params: Dict) -> str:
+        payload = json.dumps({
+            "prompt": hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+            "record": record,
+            "params": params,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @property
+    def live_bytes(self) -> int:
+        return sum(entry['length'] for entry in self.index.values())
+
+    def _load(self) -> None:
+        data_size = self.data_path.stat().st_size if self.data_path.exists() else 0
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if stored.get('data_size') == data_size:
+                    self.index = stored['entries']
+                    return
+            except (json.JSONDecodeError, KeyError):
+                pass
+        self.index = self._scan()
+        self.dirty = True
+
+    def _scan(self) -> Dict[str, Dict]:
+        """Rebuilds the index from the log; later headers override earlier ones for the same key."""
+        index = {}
+        if not self.data_path.exists():
+            return index
+        with open(self.data_path, 'rb') as f:
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    header = json.loads(line)
+                    key, length = header['key'], header['length']
+                except (ValueError, KeyError, TypeError):
+                    # A header cut off by an interrupted write; resume at the next one.
+                    self._resync(f, start + 1)
+                    continue
+                offset = f.tell()
+                if header.get('deleted'):
+                    index.pop(key, None)
+                    continue
+                try:
+                    zlib.decompress(f.read(length))
+                except zlib.error:
+                    # A payload cut off by an interrupted write: the next header starts inside
+                    # the bytes just read, so skip only this entry.
+                    self._resync(f, offset)
+                    continue
+                index[key] = {
+                    "offset": offset,
+                    "length": length,
+                    "prompt_version": header['prompt_version'],
+                    "uris": header['uris'],
+                    "created": header['created'],
+                    "last_used": header['created'],
+                }
+        return index
+
+    @staticmethod
+    def _resync(f, position: int) -> None:
+        """Seeks f to the first entry header at or after position, or to the end of the log."""
+        marker = b'{"key": '
+        f.seek(position)
+        tail = b""
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                return
+            data = tail + block
+            found = data.find(marker)
+            if found >= 0:
+                f.seek(f.tell() - len(data) + found)
+                return
+            tail = data[-(len(marker) - 1):]
+
+    def _append(self, header: Dict, payload: bytes = b"") -> int:
+        self.data.write((json.dumps(header, ensure_ascii=False) + "\n").encode('utf-8'))
+        offset = self.data.tell()
+        self.data.write(payload)
+        self.data.flush()
+        return offset
+
+    def _read(self, entry: Dict) -> str:
+        with open(self.data_path, 'rb') as f:
+            f.seek(entry['offset'])
+            return zlib.decompress(f.read(entry['length'])).decode('utf-8')
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached value for key, or None; an unreadable entry is dropped and counts as a miss."""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            try:
+                value = self._read(entry)
+            except (zlib.error, UnicodeDecodeError):
+                self._delete(key)
+                return None
+            entry['last_used'] = time.time()
+            self.dirty = True
+            return value
+
+    def put(self, key: str, value: str, prompt_version: str, uris: List) -> None:
+        payload = zlib.compress(value.encode('utf-8'), 6)
+        created = time.time()
+        with self.lock:
+            header = {"key": key, "prompt_version": prompt_version, "uris": uris,
+                      "created": created, "length": len(payload)}
+            offset = self._append(header, payload)
+            self.index[key] = {"offset": offset, "length": len(payload), "prompt_version": prompt_version,
+                               "uris": uris, "created": created, "last_used": created}
+            self.dirty = True
+            self._evict()
+
+    def _delete(self, key: str) -> None:
+        self.index.pop(key)
+        self._append({"key": key, "deleted": True, "length": 0})
+        self.dirty = True
+
+    def _evict(self) -> None:
+        live = self.live_bytes
+        if live <= self.max_bytes:
+            return
+        for key in sorted(self.index, key=lambda k: self.index[k]['last_used']):
+            if live <= self.max_bytes:
+                break
+            live -= self.index[key]['length']
+            self._delete(key)
+
+    def invalidate(self, prompt_version: Optional[str] = None, keep_version: Optional[str] = None) -> int:
+        """Drops every entry of prompt_version, or every entry not of keep_version; returns how many."""
+        with self.lock:
+            keys = [key for key, entry in self.index.items()
+                    if (prompt_version is not None and entry['prompt_version'] == prompt_version)
+                    or (keep_version is not None and entry['prompt_version'] != keep_version)]
+            for key in keys:
+                self._delete(key)
+            return len(keys)
+
+    def clear(self) -> int:
+        """Drops every entry; returns how many."""
+        with self.lock:
+            keys = list(self.index)
+            for key in keys:
+                self._delete(key)
+            return len(keys)
+
+    def compact(self) -> None:
+        """Rewrites the log with only the live entries and drops tombstones."""
+        with self.lock:
+            tmp_path = self.data_path.with_name(self.data_path.name + ".tmp")
+            self.data.close()
+            with open(self.data_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for key, entry in sorted(self.index.items(), key=lambda item: item[1]['offset']):
+                    src.seek(entry['offset'])
+                    payload = src.read(entry['length'])
+                    header = {"key": key, "prompt_version": entry['prompt_version'], "uris": entry['uris'],
+                              "created": entry['created'], "length": entry['length']}
+                    dst.write((json.dumps(header, ensure_ascii=False) + "\n").encode('utf-8'))
+                    entry['offset'] = dst.tell()
+                    dst.write(payload)
+            os.replace(tmp_path, self.data_path)
+            self.data = open(self.data_path, 'ab')
+            self.dirty = True
+        self.save()
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            self.data.flush()
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"data_size": self.data.tell(), "entries": self.index}, f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+
+    def close(self) -> None:
+        # Compact once tombstones and dead payloads outweigh the live data.
+        if self.data.tell() > 2 * self.live_bytes + (1 << 20):
+            self.compact()
+        self.save()
+        self.data.close()
+
+    def stats(self) -> Dict:
+        versions = {}
+        for entry in self.index.values():
+            versions[entry['prompt_version']] = versions.get(entry['prompt_version'], 0) + 1
+        return {"entries": len(self.index), "live_bytes": self.live_bytes,
+                "log_bytes": self.data.tell(), "prompt_versions": versions}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and maintain the LLM response cache.")
+    parser.add_argument("command", choices=["stats", "invalidate", "compact", "clear"])
+    parser.add_argument("--cache_dir", default=".llm_cache")
+    parser.add_argument("--prompt_version", default=None, help="invalidate: drop this version")
+    parser.add_argument("--keep_version", default=None, help="invalidate: drop every other version")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_dir)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "invalidate":
+        if args.prompt_version is None and args.keep_version is None:
+            parser.error("invalidate needs --prompt_version or --keep_version")
+        print(f"Invalidated {cache.invalidate(args.prompt_version, args.keep_version)} entries")
+    elif args.command == "compact":
+        cache.compact()
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        print(f"Cleared {cache.clear()} entries")
+    cache.close()